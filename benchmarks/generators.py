@@ -0,0 +1,153 @@
+import argparse
+import gc
+import ipaddress
+import sys
+import time
+import tracemalloc
+
+from utils import SRC_DIR, compare, load_results, save_results
+
+sys.path.insert(0, SRC_DIR)
+
+from common.config import resolve_config  # noqa: E402
+
+
+def synthetic_tags(count):
+    tags = {f"Tag{i}": f"value-{i}" for i in range(count)}
+    tags["env"] = "dev"
+
+    return tags
+
+
+def network_config(azs, tags):
+    # One public and one private /24 per AZ carved out of a /8
+    subnets = ipaddress.ip_network("10.0.0.0/8").subnets(new_prefix=24)
+    return resolve_config(
+        "network",
+        "dev",
+        {
+            "vpc_cidr_block": "10.0.0.0/8",
+            "availability_zones": [f"us-east-1-az{i}" for i in range(azs)],
+            "public_subnet_cidr_blocks": [str(next(subnets)) for _ in range(azs)],
+            "private_subnet_cidr_blocks": [str(next(subnets)) for _ in range(azs)],
+            "tags": synthetic_tags(tags),
+        },
+    )
+
+
+def ecs_service_configs(services, tags):
+    return [
+        resolve_config(
+            "ecs_service",
+            "dev",
+            {"service_name": f"service-{i}", "tags": synthetic_tags(tags)},
+        )
+        for i in range(services)
+    ]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+
+    return result, time.perf_counter() - start
+
+
+def measure(generate_template, configs, runs):
+    # Every phase is timed separately over all configs, the best run is kept.
+    # Memory is traced in an extra run so tracemalloc does not skew timings
+    result = {}
+    for _ in range(runs):
+        gc.collect()
+        templates, construct = timed(lambda: [generate_template(d) for d in configs])
+        dicts, to_dict = timed(lambda: [t.to_dict() for t in templates])
+        json_docs, to_json = timed(lambda: [t.to_json() for t in templates])
+        _, to_yaml = timed(lambda: [t.to_yaml() for t in templates])
+        for phase, elapsed in (
+            ("construct_s", construct),
+            ("to_dict_s", to_dict),
+            ("to_json_s", to_json),
+            ("to_yaml_s", to_yaml),
+        ):
+            result[phase] = min(result.get(phase, elapsed), elapsed)
+        result["resources"] = sum(len(d["Resources"]) for d in dicts)
+        result["json_bytes"] = sum(len(doc) for doc in json_docs)
+        del templates, dicts, json_docs
+
+    gc.collect()
+    tracemalloc.start()
+    templates = [generate_template(d) for d in configs]
+    result["construct_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    for t in templates:
+        t.to_yaml()
+    result["to_yaml_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result
+
+
+def run(azs, services, tags, runs):
+    from pkg.ecs_service import generate_template as generate_ecs_service
+    from pkg.network import generate_template as generate_network
+
+    results = {}
+    for tag_count in tags:
+        for az_count in azs:
+            case = f"network-azs{az_count}-tags{tag_count}"
+            results[case] = measure(
+                generate_network, [network_config(az_count, tag_count)], runs
+            )
+            print_result(case, results[case])
+        for service_count in services:
+            case = f"ecs_service-services{service_count}-tags{tag_count}"
+            results[case] = measure(
+                generate_ecs_service,
+                ecs_service_configs(service_count, tag_count),
+                runs,
+            )
+            print_result(case, results[case])
+
+    return results
+
+
+def print_result(case, result):
+    print(
+        f"{case:32} {result['resources']:6} resources"
+        f"  construct {result['construct_s'] * 1000:8.1f} ms"
+        f"  to_dict {result['to_dict_s'] * 1000:8.1f} ms"
+        f"  to_json {result['to_json_s'] * 1000:8.1f} ms"
+        f"  to_yaml {result['to_yaml_s'] * 1000:8.1f} ms"
+        f"  peak {result['to_yaml_peak_bytes'] / 1024 / 1024:7.1f} MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generation time and memory with scaled-up synthetic configs."
+    )
+    parser.add_argument("--azs", nargs="+", type=int, default=[2, 8, 32])
+    parser.add_argument("--services", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument(
+        "--tags", nargs="+", type=int, default=[3, 50], help="Tags per resource"
+    )
+    parser.add_argument("-n", "--runs", type=int, default=3)
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase reported as a regression (default: 0.1)",
+    )
+    args = parser.parse_args()
+
+    baseline = load_results(args.compare) if args.compare else None
+
+    results = run(args.azs, args.services, args.tags, args.runs)
+    print(f"results: {save_results('generators', results)}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        sys.exit(1 if regressions else 0)
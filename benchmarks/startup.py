@@ -0,0 +1,101 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from utils import SRC_DIR, compare, load_results, save_results
+
+# Entry scripts and the arguments they are benchmarked with, {tmp} is a
+# scratch directory removed after the run
+SCRIPTS = {
+    "network": ["network.py"],
+    "ecs_fargate": ["ecs_fargate.py"],
+    "ecs_service": ["ecs_service.py"],
+    "s3_cloudfront": ["s3_cloudfront.py"],
+    "build": ["build.py", "--no-cache", "--output-dir", "{tmp}/build"],
+    "build_cached": [
+        "build.py",
+        "--cache-dir",
+        "{tmp}/cache",
+        "--output-dir",
+        "{tmp}/build",
+    ],
+}
+
+
+def run_once(args, env):
+    # wait4 returns the rusage of that child only, ru_maxrss is in KB on Linux
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable] + args, cwd=SRC_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"{' '.join(args)} failed")
+
+    return elapsed, rusage.ru_maxrss * 1024
+
+
+def benchmark(scripts, runs, python_env):
+    env = dict(os.environ, PYTHON_ENV=python_env)
+    tmp = tempfile.mkdtemp()
+    results = {}
+    try:
+        for name in scripts:
+            args = [arg.format(tmp=tmp) for arg in SCRIPTS[name]]
+            times, rss = [], []
+            for _ in range(runs):
+                elapsed, maxrss = run_once(args, env)
+                times.append(elapsed)
+                rss.append(maxrss)
+            times.sort()
+            results[name] = {
+                "min_s": times[0],
+                "median_s": times[len(times) // 2],
+                "peak_rss_bytes": max(rss),
+            }
+    finally:
+        shutil.rmtree(tmp)
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Cold-start time and peak RSS of the entry scripts."
+    )
+    parser.add_argument("-s", "--scripts", nargs="+", choices=SCRIPTS, default=SCRIPTS)
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--env", default="dev", help="PYTHON_ENV of the runs")
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase reported as a regression (default: 0.1)",
+    )
+    args = parser.parse_args()
+
+    baseline = load_results(args.compare) if args.compare else None
+
+    results = benchmark(args.scripts, args.runs, args.env)
+
+    path = save_results("startup", results)
+
+    for name, result in results.items():
+        print(
+            f"{name:15} median {result['median_s'] * 1000:8.1f} ms"
+            f"  min {result['min_s'] * 1000:8.1f} ms"
+            f"  peak rss {result['peak_rss_bytes'] / 1024 / 1024:6.1f} MB"
+        )
+    print(f"results: {path}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        sys.exit(1 if regressions else 0)
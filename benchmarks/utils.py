@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCHMARKS_DIR, "..", "src")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Result metrics compared between runs, anything else is informational
+METRIC_SUFFIXES = ("_s", "_bytes")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(name, results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{name}-{git_commit()}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    return path
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for case, result in results.items():
+        for metric, after in sorted(result.items()):
+            if not metric.endswith(METRIC_SUFFIXES):
+                continue
+            before = baseline.get(case, {}).get(metric)
+            if before and (after - before) / before > threshold:
+                regressions.append(f"{case} {metric}: {before:.4g} -> {after:.4g}")
+
+    return regressions
@@ -0,0 +1,148 @@
+#!/usr/bin/python
+
+import hashlib
+import io
+import os
+import sys
+import tempfile
+
+from ansible.module_utils.basic import AnsibleModule
+
+DOCUMENTATION = """
+---
+module: troposphere_template
+short_description: Generate a CloudFormation template with troposphere
+description:
+  - Runs the generator of a stack in the module process, without spawning
+    the stack script, and returns the content hash of the template.
+  - The template is only written when dest is set or write is true, and dest
+    is left untouched when its content is already up to date.
+options:
+  stack:
+    description: Stack to generate (network, ecs_fargate, ecs_service or s3_cloudfront)
+    required: true
+  env:
+    description: Environment whose config is used
+    required: true
+  src:
+    description: Path of the src directory of the repository
+    required: true
+  format:
+    description: Template format
+    choices: [yaml, json]
+    default: yaml
+  dest:
+    description: Path the template is written to
+  write:
+    description: Write the template to a unique temporary file when dest is not set
+    type: bool
+    default: false
+  return_template:
+    description: Return the template as a dict
+    type: bool
+    default: false
+  cache_dir:
+    description: Directory of the rendered template cache, no cache when not set
+"""
+
+EXAMPLES = """
+- name: Generate network template
+  troposphere_template:
+    stack: network
+    env: dev
+    src: /path/to/troposphere-templates/src
+    dest: /path/to/build/network.yaml
+"""
+
+RETURN = """
+hash:
+  description: sha256 of the rendered template
+  returned: always
+path:
+  description: Path of the written template
+  returned: when dest is set or write is true, not for write in check mode
+template:
+  description: The template
+  returned: when return_template is true
+"""
+
+
+def render(stack, config, fmt, cache):
+    from common.build import render_stack
+
+    stream = io.StringIO()
+    render_stack(stack, config, stream, fmt, cache)
+
+    return stream.getvalue()
+
+
+def write(path, body):
+    from common.writer import replace_file
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with replace_file(path) as f:
+        f.write(body)
+
+
+def main():
+    module = AnsibleModule(
+        argument_spec=dict(
+            stack=dict(type="str", required=True),
+            env=dict(type="str", required=True),
+            src=dict(type="path", required=True),
+            format=dict(type="str", default="yaml", choices=["yaml", "json"]),
+            dest=dict(type="path"),
+            write=dict(type="bool", default=False),
+            return_template=dict(type="bool", default=False),
+            cache_dir=dict(type="path"),
+        ),
+        supports_check_mode=True,
+    )
+    params = module.params
+    sys.path.insert(0, params["src"])
+
+    from common.cache import TemplateCache
+    from common.config import resolve_config
+
+    cache = None
+    if params["cache_dir"]:
+        cache = TemplateCache(params["cache_dir"])
+
+    try:
+        config = resolve_config(params["stack"], params["env"])
+        body = render(params["stack"], config, params["format"], cache)
+    except Exception as e:
+        module.fail_json(msg=f"Could not generate {params['stack']}: {e}")
+
+    result = dict(changed=False, hash=hashlib.sha256(body.encode()).hexdigest())
+    if params["return_template"]:
+        from cfn_flip import load
+
+        result["template"] = load(body)[0]
+
+    path = params["dest"]
+    if path is None and params["write"]:
+        # A new file is always a change, check mode only reports it
+        if module.check_mode:
+            result["changed"] = True
+            module.exit_json(**result)
+        fd, path = tempfile.mkstemp(
+            prefix=f"{params['stack']}-", suffix=f".{params['format']}"
+        )
+        os.close(fd)
+    if path is not None:
+        result["path"] = path
+        current = None
+        if os.path.exists(path):
+            with open(path) as f:
+                current = f.read()
+        if current != body:
+            result["changed"] = True
+            if not module.check_mode:
+                write(path, body)
+
+    module.exit_json(**result)
+
+
+if __name__ == "__main__":
+    main()
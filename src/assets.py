@@ -0,0 +1,38 @@
+import argparse
+import os
+
+from common.assets import build_assets
+from common.config import resolve_config
+
+parser = argparse.ArgumentParser(
+    description="Fingerprint and precompress the static content assets, "
+    "rewriting their references in the pages."
+)
+parser.add_argument(
+    "root",
+    nargs="?",
+    default=os.path.join(os.path.dirname(__file__), "..", "static_content"),
+    help="Directory of the static content (default: static_content)",
+)
+parser.add_argument(
+    "-o",
+    "--output-dir",
+    default=os.path.join("build", "static_content"),
+    help="Directory the content is written to, replacing it "
+    "(default: build/static_content)",
+)
+parser.add_argument(
+    "-e", "--env", default=os.environ.get("PYTHON_ENV"), help="Environment"
+)
+args = parser.parse_args()
+
+config = resolve_config("s3_cloudfront", args.env)
+try:
+    manifest = build_assets(
+        args.root, args.output_dir, config["precompressed_encodings"]
+    )
+except ValueError as e:
+    raise SystemExit(str(e))
+
+for key, fingerprinted in manifest.items():
+    print(f"{key}: {fingerprinted}")
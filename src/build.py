@@ -0,0 +1,231 @@
+import argparse
+import json
+import os
+import sys
+
+from cfn_flip import load
+
+from common.build import (
+    FORMATS,
+    STACKS,
+    build_matrix,
+    build_templates,
+    check_imports,
+    write_parameterized,
+)
+from common.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE, TemplateCache
+from common.config import ENVIRONMENTS
+from common.graph import critical_path
+from common.size import exceeds_limits, optimize_template
+
+
+def format_report(report):
+    return (
+        f"{report['bytes']} bytes ({report['bytes_headroom']} left), "
+        f"{report['resources']} resources ({report['resources_headroom']} left), "
+        f"{report['outputs']} outputs ({report['outputs_headroom']} left)"
+    )
+
+
+def main():
+    # The worker processes of --envs import this module again when they are
+    # spawned, so nothing runs at import time
+    parser = argparse.ArgumentParser(
+        description="Generate the templates of several stacks in a single run."
+    )
+    parser.add_argument(
+        "-s",
+        "--stacks",
+        nargs="+",
+        choices=STACKS,
+        default=STACKS,
+        help="Stacks to generate (default: all)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output-dir",
+        default="build",
+        help="Directory the templates are written to (default: build)",
+    )
+    parser.add_argument("-f", "--format", choices=FORMATS, default="yaml")
+    parser.add_argument(
+        "-e",
+        "--envs",
+        nargs="+",
+        help="Environments to generate in parallel, each one into its own "
+        "subdirectory (default: only the PYTHON_ENV environment)",
+    )
+    parser.add_argument(
+        "--parameterized",
+        action="store_true",
+        help="Generate a single template per stack for all the --envs (default: "
+        "every environment), taking an Env parameter, and a "
+        "<stack>-<env>-parameters.json file per environment",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of worker processes used with --envs (default: CPU count)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Directory of the rendered template cache (default: {DEFAULT_CACHE_DIR})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_MAX_SIZE // (1024 * 1024),
+        help="Maximum size of the cache in MB before old entries are evicted",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always regenerate the templates, bypassing the cache",
+    )
+    parser.add_argument(
+        "--purge-cache",
+        action="store_true",
+        help="Remove every cached template before generating",
+    )
+    parser.add_argument(
+        "--minify",
+        action="store_true",
+        help="Write the templates as minified json (needs --format json)",
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="Print the size and resource count headroom of every template",
+    )
+    parser.add_argument(
+        "--split-url",
+        help="Split the templates over the CloudFormation limits into nested "
+        "stacks, the nested templates are written next to the template and "
+        "referenced under this URL",
+    )
+    parser.add_argument(
+        "--inline",
+        action="store_true",
+        help="Check against the inline template limit instead of the S3 one",
+    )
+    parser.add_argument(
+        "--consumers",
+        nargs="+",
+        default=[],
+        metavar="EXPORT",
+        help="Print the stacks importing each of these export names",
+    )
+    parser.add_argument(
+        "--critical-path",
+        action="store_true",
+        help="Print the estimated creation critical path of every template and "
+        "warn when it got longer than in the previous build of the output directory",
+    )
+    args = parser.parse_args()
+
+    if args.minify and args.format != "json":
+        parser.error("--minify needs --format json")
+
+    cache = TemplateCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    if args.purge_cache:
+        cache.purge()
+    if args.no_cache:
+        cache = None
+
+    if args.parameterized:
+        envs = args.envs or sorted(set(ENVIRONMENTS.values()))
+        os.makedirs(args.output_dir, exist_ok=True)
+        paths = {
+            (None, stack): write_parameterized(
+                args.output_dir, stack, envs, args.format, cache
+            )
+            for stack in args.stacks
+        }
+    elif args.envs:
+        paths = build_matrix(
+            args.output_dir,
+            args.envs,
+            args.stacks,
+            args.format,
+            args.jobs,
+            cache.cache_dir if cache else None,
+            args.cache_size * 1024 * 1024,
+        )
+    else:
+        paths = {
+            (None, stack): path
+            for stack, path in build_templates(
+                args.output_dir, args.stacks, args.format, cache
+            ).items()
+        }
+
+    # Every import must match an export of one of the stacks of its environment
+    for env in dict.fromkeys(env for env, _ in paths):
+        check_envs = [env or os.environ.get("PYTHON_ENV")]
+        if args.parameterized:
+            check_envs = envs
+        for check_env in check_envs:
+            try:
+                index = check_imports(
+                    {stack: path for (e, stack), path in paths.items() if e == env},
+                    check_env,
+                )
+            except ValueError as e:
+                raise SystemExit(f"{check_env}: {e}")
+        for name in args.consumers:
+            consumers = ", ".join(index.consumers(name)) or "none"
+            print(f"{env + ' ' if env else ''}{name}: {consumers}")
+
+    baseline_path = os.path.join(args.output_dir, "critical-path.json")
+    baseline = {}
+    if args.critical_path and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    over_limits = []
+    for (env, stack), path in paths.items():
+        label = f"{env} {stack}" if env else stack
+        print(f"{label}: {path}")
+
+        if args.critical_path:
+            with open(path) as f:
+                resources = load(f.read())[0]["Resources"]
+            chain, seconds = critical_path(resources)
+            print(f"  critical path: {' -> '.join(chain)} (~{seconds}s)")
+            if seconds > baseline.get(label, seconds):
+                print(
+                    f"warning: {label} critical path went from ~{baseline[label]}s "
+                    f"to ~{seconds}s",
+                    file=sys.stderr,
+                )
+            baseline[label] = seconds
+
+        # Templates are checked against the limits even when they are not
+        # optimized, troposphere lets them go over the resource limit
+        report, nested = optimize_template(
+            path, stack, args.minify, args.split_url, args.inline
+        )
+        if exceeds_limits(report) or any(map(exceeds_limits, nested.values())):
+            over_limits.append(label)
+        if args.report:
+            print(f"  {format_report(report)}")
+        for nested_path, nested_report in nested.items():
+            print(f"  nested: {nested_path}")
+            if args.report:
+                print(f"    {format_report(nested_report)}")
+
+    if args.critical_path:
+        with open(baseline_path, "w") as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+
+    if over_limits:
+        hint = "" if args.split_url else ", split them with --split-url"
+        raise SystemExit(
+            f"Over the CloudFormation limits: {', '.join(over_limits)}{hint}"
+        )
+
+
+if __name__ == "__main__":
+    main()
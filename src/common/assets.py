@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import os
+import re
+import shutil
+
+# Directory the fingerprinted assets are written to, served by a long TTL
+# cache behavior
+ASSETS_DIR = "assets"
+
+# Variants written next to the compressible files, by content encoding
+ENCODINGS = {"br": ".br", "gzip": ".gz"}
+COMPRESSIBLE = (".css", ".html", ".ico", ".js", ".json", ".svg", ".txt", ".xml")
+
+PAGES = (".html",)
+
+# Tag sync.py puts on the assets the published pages no longer reference,
+# instead of deleting them while cached pages may still load them. The
+# bucket expires them with a lifecycle rule
+SUPERSEDED_TAG = ("superseded", "true")
+# An empty object is put under this prefix for every superseded asset, with
+# the same tag, so a sync finds them with one listing instead of reading the
+# tags of every asset
+SUPERSEDED_PREFIX = ".superseded/"
+
+REFERENCE = re.compile(r"""(\b(?:href|src)\s*=\s*["'])([^"'#?]+)([^"']*["'])""")
+CSS_URL = re.compile(r"""(url\(\s*["']?)([^"'#?)]+)([^)]*\))""")
+
+
+def fingerprinted(key, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    directory, name = os.path.split(key)
+    stem, ext = os.path.splitext(name)
+
+    return "/".join(p for p in (ASSETS_DIR, directory, f"{stem}.{digest}{ext}") if p)
+
+
+def rewrite(text, pattern, base, manifest, depth):
+    # Points the relative references of a file at the fingerprinted keys,
+    # depth is the number of directories between the file and the root
+    def replace(match):
+        reference = match.group(2)
+        if re.match(r"^(?:[a-z]+:|//|/)", reference):
+            return match.group(0)
+        key = os.path.normpath(os.path.join(base, reference)).replace(os.sep, "/")
+        if key not in manifest:
+            return match.group(0)
+        return match.group(1) + "../" * depth + manifest[key] + match.group(3)
+
+    return pattern.sub(replace, text)
+
+
+def compress(path, encodings):
+    # Writes the variants of path for each encoding, returns their paths
+    with open(path, "rb") as f:
+        content = f.read()
+
+    paths = []
+    for encoding in encodings:
+        if encoding == "gzip":
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        elif encoding == "br":
+            try:
+                import brotli
+            except ImportError:
+                raise ValueError("Brotli variants need the brotli package")
+            compressed = brotli.compress(content, quality=11)
+        else:
+            raise ValueError(
+                f"Unknown encoding {encoding}, expected one of {list(ENCODINGS)}"
+            )
+        # Written even when not smaller, the edge function rewrites every
+        # compressible asset request to the variant
+        paths.append(path + ENCODINGS[encoding])
+        with open(paths[-1], "wb") as f:
+            f.write(compressed)
+
+    return paths
+
+
+def build_assets(root, output_dir, encodings=("br", "gzip")):
+    # Copies root to output_dir with every file but the pages renamed to
+    # assets/<name>.<hash>.<ext>, references in the pages and stylesheets
+    # rewritten, and compressed variants of the compressible assets. Pages
+    # keep their names and are compressed by CloudFront. Returns
+    # {original key: fingerprinted key}
+    from common.sync import local_files
+
+    files = local_files(root)
+    pages = [key for key in files if key.endswith(PAGES)]
+    styles = [key for key in files if key.endswith(".css")]
+    others = [key for key in files if key not in pages and key not in styles]
+
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+
+    manifest = {}
+
+    def write(key, content):
+        path = os.path.join(output_dir, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        if key.startswith(ASSETS_DIR + "/") and key.endswith(COMPRESSIBLE):
+            compress(path, encodings)
+
+    # Stylesheets can reference the other assets, so their hash is taken
+    # after the rewrite
+    for key in others:
+        with open(files[key], "rb") as f:
+            content = f.read()
+        manifest[key] = fingerprinted(key, content)
+        write(manifest[key], content)
+    for key in styles:
+        with open(files[key], encoding="utf-8") as f:
+            text = f.read()
+        depth = fingerprinted(key, b"").count("/")
+        text = rewrite(text, CSS_URL, os.path.dirname(key), manifest, depth)
+        content = text.encode("utf-8")
+        manifest[key] = fingerprinted(key, content)
+        write(manifest[key], content)
+    for key in pages:
+        with open(files[key], encoding="utf-8") as f:
+            text = f.read()
+        depth = key.count("/")
+        text = rewrite(text, REFERENCE, os.path.dirname(key), manifest, depth)
+        write(key, text.encode("utf-8"))
+
+    return manifest
@@ -0,0 +1,205 @@
+import importlib
+import io
+import json
+import os
+import shutil
+
+from common.cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE, TemplateCache, cache_key
+from common.config import resolve_config
+
+# Stacks in deploy order, each one has a config/<stack> package and a
+# pkg/<stack> generator module
+STACKS = ["network", "ecs_fargate", "ecs_service", "s3_cloudfront"]
+
+FORMATS = ["yaml", "json"]
+
+
+def load_generator(stack):
+    if stack not in STACKS:
+        raise ValueError(f"Unknown stack {stack}, expected one of {STACKS}")
+    return importlib.import_module(f"pkg.{stack}")
+
+
+def generate(stack, config):
+    # Templates over the resource or output limits are still generated,
+    # build.py splits them or reports them
+    from common.size import lifted_template_limits
+
+    with lifted_template_limits():
+        return load_generator(stack).generate_template(config)
+
+
+def load_config(stack):
+    return importlib.import_module(f"config.{stack}.config").config
+
+
+def render_stack(stack, config, stream, fmt="yaml", cache=None):
+    # Writes the template of the stack to stream, the same for build.py, the
+    # stack scripts and the troposphere_template module: from the cache when
+    # possible, otherwise generated with its redundant DependsOn pruned. The
+    # generator module is only imported on a cache miss
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {FORMATS}")
+
+    if cache is not None:
+        key = cache_key(stack, config, fmt)
+        cached = cache.lookup(key, fmt)
+        if cached is not None:
+            with open(cached) as f:
+                shutil.copyfileobj(f, stream)
+            return
+
+    from common.graph import prune_depends_on
+    from common.writer import write_template
+
+    t = generate(stack, config)
+    prune_depends_on(t)
+    if cache is None:
+        write_template(t, stream, fmt)
+        return
+
+    body = io.StringIO()
+    write_template(t, body, fmt)
+    stream.write(body.getvalue())
+    cache.store_body(key, fmt, body.getvalue())
+
+
+def write_stack(path, stack, config, fmt="yaml", cache=None):
+    from common.writer import replace_file
+
+    with replace_file(path) as f:
+        render_stack(stack, config, f, fmt, cache)
+
+    return path
+
+
+def write_parameterized(output_dir, stack, envs, fmt="yaml", cache=None):
+    # Writes a single template serving every environment, selected with its
+    # Env parameter, and the parameter values of each environment to
+    # <stack>-<env>-parameters.json. Returns the template path
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt}, expected one of {FORMATS}")
+
+    configs = {env: resolve_config(stack, env) for env in envs}
+    path = os.path.join(output_dir, f"{stack}.{fmt}")
+    parameters_paths = {
+        env: os.path.join(output_dir, f"{stack}-{env}-parameters.json") for env in envs
+    }
+
+    if cache is not None:
+        key = cache_key(stack, configs, fmt)
+        cached = [cache.lookup(key, fmt)]
+        cached += [cache.lookup(key, f"{env}.json") for env in envs]
+        if None not in cached:
+            for src, dst in zip(cached, [path] + list(parameters_paths.values())):
+                shutil.copyfile(src, dst)
+            return path
+
+    from troposphere import Template
+
+    from common.graph import prune_depends_on
+    from common.parameters import add_parameters, parameterize
+    from common.writer import write_template_file
+
+    templates = {}
+    for env, config in configs.items():
+        t = generate(stack, config)
+        prune_depends_on(t)
+        templates[env] = t.to_dict()
+    merged, values = parameterize(templates, configs)
+
+    t = Template(Description=merged.get("Description"))
+    t.set_version(merged.get("AWSTemplateFormatVersion"))
+    add_parameters(t, {"parameters": merged["Parameters"]})
+    t.mappings = merged.get("Mappings", {})
+    t.conditions = merged["Conditions"]
+    t.resources = merged["Resources"]
+    t.outputs = merged["Outputs"]
+    write_template_file(t, path, fmt)
+    for env, parameters_path in parameters_paths.items():
+        with open(parameters_path, "w") as f:
+            json.dump(values[env], f, indent=1, sort_keys=True)
+
+    if cache is not None:
+        cache.store(key, fmt, path)
+        for env, parameters_path in parameters_paths.items():
+            cache.store(key, f"{env}.json", parameters_path)
+
+    return path
+
+
+def build_templates(output_dir, stacks=None, fmt="yaml", cache=None):
+    # Single environment build, configs are read from PYTHON_ENV
+    stacks = stacks or STACKS
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = {}
+    for stack in stacks:
+        path = os.path.join(output_dir, f"{stack}.{fmt}")
+        paths[stack] = write_stack(path, stack, load_config(stack), fmt, cache)
+
+    return paths
+
+
+def check_imports(paths, env):
+    # Indexes the exports and imports of every stack of the environment and
+    # raises a ValueError when an import of the stacks just built has no
+    # matching export. paths maps those stacks to their templates, the other
+    # stacks are generated in memory. Returns the index
+    from cfn_flip import load
+
+    from common.exports import ExportIndex
+
+    index = ExportIndex()
+    built = []
+    for stack in STACKS:
+        config = resolve_config(stack, env)
+        if stack in paths:
+            with open(paths[stack]) as f:
+                template = load(f.read())[0]
+            built.append(config["stack_name"])
+        else:
+            template = generate(stack, config).to_dict()
+        index.add(config["stack_name"], template)
+    index.check(built)
+
+    return index
+
+
+def _build_job(path, stack, env, fmt, cache_dir, cache_size):
+    # Runs in a worker process, the config is resolved for the given
+    # environment and nothing is read from PYTHON_ENV
+    cache = None
+    if cache_dir is not None:
+        cache = TemplateCache(cache_dir, cache_size)
+
+    return write_stack(path, stack, resolve_config(stack, env), fmt, cache)
+
+
+def build_matrix(
+    output_dir,
+    envs,
+    stacks=None,
+    fmt="yaml",
+    jobs=None,
+    cache_dir=DEFAULT_CACHE_DIR,
+    cache_size=DEFAULT_MAX_SIZE,
+):
+    # Generates every env x stack combination in a process pool, templates
+    # are written to <output_dir>/<env>/<stack>.<fmt>. Pass cache_dir=None to
+    # bypass the cache
+    from concurrent.futures import ProcessPoolExecutor
+
+    stacks = stacks or STACKS
+
+    futures = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for env in envs:
+            os.makedirs(os.path.join(output_dir, env), exist_ok=True)
+            for stack in stacks:
+                path = os.path.join(output_dir, env, f"{stack}.{fmt}")
+                futures[(env, stack)] = executor.submit(
+                    _build_job, path, stack, env, fmt, cache_dir, cache_size
+                )
+
+    return {job: future.result() for job, future in futures.items()}
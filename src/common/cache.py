@@ -0,0 +1,103 @@
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "troposphere-templates"
+)
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def source_files(stack):
+    # Generators pull shared helpers from common, so a change there has to
+    # invalidate the cached templates as well. troposphere/__init__.py holds
+    # the library version and is read instead of importing the package
+    generator = importlib.util.find_spec(f"pkg.{stack}").origin
+    troposphere = importlib.util.find_spec("troposphere").origin
+    common_dir = os.path.dirname(os.path.abspath(__file__))
+    common = sorted(
+        os.path.join(common_dir, name)
+        for name in os.listdir(common_dir)
+        if name.endswith(".py")
+    )
+
+    return [generator, troposphere] + common
+
+
+def cache_key(stack, config, fmt):
+    h = hashlib.sha256()
+    h.update(f"{stack}\0{fmt}\0".encode())
+    h.update(json.dumps(config, sort_keys=True, default=str).encode())
+    for path in source_files(stack):
+        with open(path, "rb") as f:
+            h.update(f.read())
+
+    return h.hexdigest()
+
+
+class TemplateCache:
+    # Rendered templates stored on disk as <key>.<format>, the least recently
+    # used entries are evicted once the directory grows over max_size bytes
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, key, fmt):
+        return os.path.join(self.cache_dir, f"{key}.{fmt}")
+
+    def lookup(self, key, fmt):
+        # Returns the path of the cached template, or None on a miss
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def store(self, key, fmt, src):
+        path = self.path(key, fmt)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def store_body(self, key, fmt, body):
+        path = self.path(key, fmt)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def purge(self):
+        for _, _, path in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,99 @@
+import bisect
+import ipaddress
+
+
+def find_overlaps(cidrs):
+    # Sorts the blocks by start address and sweeps them once, keeping the
+    # block that reaches furthest so far. Any block starting before that end
+    # overlaps with it, which avoids comparing every pair
+    networks = sorted(
+        (ipaddress.ip_network(cidr) for cidr in cidrs),
+        key=lambda n: (n.network_address, n.prefixlen),
+    )
+
+    overlaps = []
+    furthest = None
+    for network in networks:
+        if (
+            furthest is not None
+            and network.network_address <= furthest.broadcast_address
+        ):
+            overlaps.append((str(furthest), str(network)))
+        if furthest is None or network.broadcast_address > furthest.broadcast_address:
+            furthest = network
+
+    return overlaps
+
+
+def check_cidrs(vpc_cidr, cidrs):
+    vpc = ipaddress.ip_network(vpc_cidr)
+    outside = [cidr for cidr in cidrs if not ipaddress.ip_network(cidr).subnet_of(vpc)]
+    if outside:
+        raise ValueError(f"Subnets {outside} are not part of the VPC block {vpc_cidr}")
+
+    overlaps = find_overlaps(cidrs)
+    if overlaps:
+        raise ValueError(f"Overlapping subnets {overlaps}")
+
+
+def next_free(cursor, size, taken):
+    # First address from cursor, aligned on size, where a block of that size
+    # overlaps none of the taken (start, end) ranges. They are sorted and do
+    # not overlap, so the scan starts at the last range starting before cursor
+    cursor = -(-cursor // size) * size
+    i = max(bisect.bisect_left(taken, (cursor,)) - 1, 0)
+    while i < len(taken) and taken[i][0] < cursor + size:
+        if taken[i][1] > cursor:
+            cursor = -(-taken[i][1] // size) * size
+        i += 1
+
+    return cursor
+
+
+def merge_ranges(ranges):
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+
+    return merged
+
+
+def plan_subnets(vpc_cidr, prefix_lengths, count, reserved=()):
+    # Allocates count subnets for each prefix length out of the VPC block,
+    # returning them in the same order as prefix_lengths. Larger blocks are
+    # carved first so every block stays aligned without leaving gaps, around
+    # the reserved blocks which are already in use
+    vpc = ipaddress.ip_network(vpc_cidr)
+    start = int(vpc.network_address)
+    end = int(vpc.broadcast_address) + 1
+    taken = merge_ranges(
+        (int(n.network_address), int(n.broadcast_address) + 1)
+        for n in map(ipaddress.ip_network, reserved)
+    )
+
+    order = sorted(range(len(prefix_lengths)), key=lambda i: prefix_lengths[i])
+    planned = [None] * len(prefix_lengths)
+    for i in order:
+        prefix_length = prefix_lengths[i]
+        if prefix_length < vpc.prefixlen or prefix_length > vpc.max_prefixlen:
+            raise ValueError(
+                f"Prefix length /{prefix_length} does not fit in {vpc_cidr}"
+            )
+        size = 1 << (vpc.max_prefixlen - prefix_length)
+        planned[i] = []
+        cursor = start
+        for _ in range(count):
+            cursor = next_free(cursor, size, taken)
+            if cursor + size > end:
+                raise ValueError(
+                    f"{vpc_cidr} has no room left for {count} more /{prefix_length} "
+                    "subnets"
+                )
+            planned[i].append(str(ipaddress.ip_network((cursor, prefix_length))))
+            bisect.insort(taken, (cursor, cursor + size))
+            cursor += size
+
+    return planned
@@ -0,0 +1,50 @@
+import copy
+import importlib
+from functools import lru_cache
+
+# Accepted environment names and the config module holding their values
+ENVIRONMENTS = {
+    "dev": "dev",
+    "development": "dev",
+    "prd": "prd",
+    "production": "prd",
+}
+
+
+def deep_merge(base, override):
+    # Nested dicts are merged key by key, any other value in override
+    # replaces the one in base
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+
+    return merged
+
+
+@lru_cache(maxsize=None)
+def _resolve(stack, env):
+    if env not in ENVIRONMENTS:
+        raise ValueError(
+            f"Unknown environment {env}, expected one of {list(ENVIRONMENTS)}"
+        )
+    default = importlib.import_module(f"config.{stack}.default").config
+    environment = importlib.import_module(f"config.{stack}.{ENVIRONMENTS[env]}").config
+
+    return deep_merge(deep_merge(default, {"env": env}), environment)
+
+
+def resolve_config(stack, env, overrides=None):
+    # Layers default -> environment -> overrides. The default/environment
+    # merge is memoized per (stack, env), callers get their own copy
+    config = copy.deepcopy(_resolve(stack, env))
+    if overrides:
+        config = deep_merge(config, overrides)
+
+    return config
+
+
+def clear_cache():
+    _resolve.cache_clear()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+
+from botocore.exceptions import ClientError
+from cfn_flip import dump_yaml, load
+
+# The hash of the last deployed template is stored both as metadata on the S3
+# object and in the Metadata section of the template. A stack tag would be
+# propagated to every resource of the stack, and updated on each of them
+HASH_METADATA = "template-hash"
+HASH_KEY = "TemplateHash"
+
+CAPABILITIES = ["CAPABILITY_IAM", "CAPABILITY_NAMED_IAM"]
+
+COMPLETE_STATUSES = ["CREATE_COMPLETE", "UPDATE_COMPLETE", "IMPORT_COMPLETE"]
+
+# Stacks that never got their resources and cannot be updated: created by a
+# change set that was not executed, or rolled back from their first create.
+# They are deleted and created again
+RECREATE_STATUSES = ["REVIEW_IN_PROGRESS", "ROLLBACK_COMPLETE"]
+
+
+def template_hash(body, parameters=None, nested=None):
+    # Parse the template so formatting, key order and json/yaml differences
+    # do not change the hash. Nested templates are part of the hash of their
+    # parent, as the parent itself does not change when only they do
+    template, _ = load(body)
+    canonical = json.dumps(
+        {
+            "Template": template,
+            "Parameters": parameters or {},
+            "Nested": {key: load(nested[key])[0] for key in sorted(nested or {})},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def object_hash(s3, bucket, key):
+    try:
+        response = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+    return response.get("Metadata", {}).get(HASH_METADATA)
+
+
+def describe_stack(cfn, stack_name):
+    try:
+        return cfn.describe_stacks(StackName=stack_name)["Stacks"][0]
+    except ClientError as e:
+        if "does not exist" in e.response["Error"]["Message"]:
+            return None
+        raise
+
+
+def stamp_template(body, digest):
+    # Records the hash in the template, in the format and layout it came in
+    template, fmt = load(body)
+    template["Metadata"] = {**template.get("Metadata", {}), HASH_KEY: digest}
+    if fmt == "yaml":
+        return dump_yaml(template)
+    if "\n" not in body.strip():
+        return json.dumps(template, separators=(",", ":"))
+
+    return json.dumps(template, indent=1)
+
+
+def stack_hash(cfn, stack):
+    # A stack that did not finish its last operation has to be deployed again
+    if stack is None or stack["StackStatus"] not in COMPLETE_STATUSES:
+        return None
+    body = cfn.get_template(StackName=stack["StackId"])["TemplateBody"]
+    # botocore already parses the body of json templates
+    template = load(body)[0] if isinstance(body, str) else body
+
+    return template.get("Metadata", {}).get(HASH_KEY)
+
+
+def template_url(bucket, key):
+    return f"https://{bucket}.s3.amazonaws.com/{key}"
+
+
+def upload_template(s3, bucket, key, body, digest):
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body.encode(),
+        Metadata={HASH_METADATA: digest},
+    )
+
+
+def update_stack(cfn, stack, stack_name, url, parameters, wait=True):
+    kwargs = dict(
+        StackName=stack_name,
+        TemplateURL=url,
+        Parameters=[
+            {"ParameterKey": k, "ParameterValue": str(v)}
+            for k, v in sorted((parameters or {}).items())
+        ],
+        Capabilities=CAPABILITIES,
+    )
+    if stack is not None:
+        # Drops the hash tag of the stacks deployed before it moved to the
+        # template Metadata, the other tags are kept
+        kwargs["Tags"] = [
+            tag for tag in stack.get("Tags", []) if tag["Key"] != HASH_KEY
+        ]
+
+    if stack is not None and stack["StackStatus"] in RECREATE_STATUSES:
+        cfn.delete_stack(StackName=stack["StackId"])
+        cfn.get_waiter("stack_delete_complete").wait(StackName=stack["StackId"])
+        stack = None
+    if stack is None:
+        cfn.create_stack(**kwargs)
+        waiter = "stack_create_complete"
+    else:
+        try:
+            cfn.update_stack(**kwargs)
+        except ClientError as e:
+            if "No updates are to be performed" in e.response["Error"]["Message"]:
+                return
+            raise
+        waiter = "stack_update_complete"
+
+    if wait:
+        cfn.get_waiter(waiter).wait(StackName=stack_name)
+
+
+def deploy_template(
+    cfn, s3, bucket, key, stack_name, body, parameters=None, nested=None, wait=True
+):
+    # Returns False when both the uploaded object and the stack already match
+    # the template, in which case nothing is uploaded or updated. nested maps
+    # the object keys of nested stack templates to their bodies
+    digest = template_hash(body, parameters, nested)
+    stack = describe_stack(cfn, stack_name)
+    uploaded = object_hash(s3, bucket, key) == digest
+
+    if uploaded and stack_hash(cfn, stack) == digest:
+        return False
+
+    for nested_key, nested_body in sorted((nested or {}).items()):
+        nested_digest = template_hash(nested_body)
+        if object_hash(s3, bucket, nested_key) != nested_digest:
+            upload_template(s3, bucket, nested_key, nested_body, nested_digest)
+    if not uploaded:
+        upload_template(s3, bucket, key, stamp_template(body, digest), digest)
+    update_stack(cfn, stack, stack_name, template_url(bucket, key), parameters, wait)
+
+    return True
@@ -0,0 +1,20 @@
+def capacity_provider_strategy(cls, strategy):
+    # strategy is a list of {capacity_provider, base, weight}. Only one
+    # capacity provider may run a base of tasks, the tasks over the bases are
+    # split by weight
+    based = [item["capacity_provider"] for item in strategy if item.get("base")]
+    if len(based) > 1:
+        raise ValueError(f"Only one capacity provider may set a base, got {based}")
+    if not any(item.get("weight") for item in strategy):
+        raise ValueError(
+            "A capacity provider strategy needs a capacity provider with a weight"
+        )
+
+    return [
+        cls(
+            CapacityProvider=item["capacity_provider"],
+            Base=item.get("base", 0),
+            Weight=item.get("weight", 0),
+        )
+        for item in strategy
+    ]
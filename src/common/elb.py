@@ -0,0 +1,9 @@
+def elb_attributes(cls, values):
+    # Load balancer and target group attributes are key/value strings,
+    # booleans written in lower case
+    return [
+        cls(
+            Key=key, Value=str(value).lower() if isinstance(value, bool) else str(value)
+        )
+        for key, value in values.items()
+    ]
@@ -0,0 +1,126 @@
+import re
+
+from common.size import PARENT_STACK_NAME, SUB_VARIABLE
+
+
+def resolve_name(value, stack_name):
+    # Evaluates an export or import name knowing only AWS::StackName, returns
+    # None when it depends on anything else. In a nested stack split out of
+    # the template, the ParentStackName parameter stands for AWS::StackName
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, dict) or len(value) != 1:
+        return None
+
+    ((function, argument),) = value.items()
+    if function == "Ref":
+        return stack_name if argument in ("AWS::StackName", PARENT_STACK_NAME) else None
+    if function == "Fn::Sub":
+        string, variables = argument, {}
+        if isinstance(argument, list):
+            string, variables = argument[0], argument[1]
+        values = {"AWS::StackName": stack_name}
+        for variable, variable_value in variables.items():
+            values[variable] = resolve_name(variable_value, stack_name)
+        name = SUB_VARIABLE.sub(
+            lambda match: values.get(match.group(1)) or match.group(0), string
+        )
+        return None if re.search(r"\$\{[^!]", name) else name
+    if function == "Fn::Join":
+        delimiter, parts = argument
+        if not isinstance(parts, list):
+            return None
+        parts = [resolve_name(part, stack_name) for part in parts]
+        return None if None in parts else delimiter.join(parts)
+
+    return None
+
+
+def find_imports(value):
+    # Yields the argument of every Fn::ImportValue
+    if isinstance(value, list):
+        for item in value:
+            yield from find_imports(item)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key == "Fn::ImportValue":
+                yield item
+            else:
+                yield from find_imports(item)
+
+
+def template_exports(template, stack_name):
+    exports = {}
+    for output_name, output in template.get("Outputs", {}).items():
+        if "Export" in output:
+            name = resolve_name(output["Export"]["Name"], stack_name)
+            if name is not None:
+                exports[name] = output_name
+
+    return exports
+
+
+def template_imports(template, stack_name):
+    # Names that cannot be resolved at build time are left out
+    names = (resolve_name(value, stack_name) for value in find_imports(template))
+
+    return {name for name in names if name is not None}
+
+
+class ExportIndex:
+    # Maps every export name to the stack and output producing it, and every
+    # stack to the names it imports. Filled from the rendered templates so
+    # imports can be checked before anything is deployed
+    def __init__(self):
+        self.exports = {}
+        self.imports = {}
+
+    def add(self, stack_name, template):
+        for name, output_name in template_exports(template, stack_name).items():
+            producer = self.exports.get(name)
+            if producer is not None and producer[0] != stack_name:
+                raise ValueError(
+                    f"Export {name} of {stack_name} is already exported by "
+                    f"{producer[0]}"
+                )
+            self.exports[name] = (stack_name, output_name)
+        # A stack split into nested stacks is added once per template
+        self.imports.setdefault(stack_name, set()).update(
+            template_imports(template, stack_name)
+        )
+
+    def producer(self, name):
+        producer = self.exports.get(name)
+        return producer[0] if producer else None
+
+    def consumers(self, name):
+        return sorted(
+            stack_name for stack_name, names in self.imports.items() if name in names
+        )
+
+    def missing(self, stack_names=None):
+        # (stack, import) pairs no indexed stack exports
+        return sorted(
+            (stack_name, name)
+            for stack_name in stack_names or self.imports
+            for name in self.imports[stack_name]
+            if name not in self.exports
+        )
+
+    def check(self, stack_names=None):
+        missing = self.missing(stack_names)
+        if missing:
+            raise ValueError(
+                "Imports without a matching export: "
+                + ", ".join(f"{name} (in {stack_name})" for stack_name, name in missing)
+            )
+
+    def dependencies(self):
+        # Stacks each stack depends on, imports without a producer in the
+        # index are expected to exist already
+        graph = {}
+        for stack_name, names in self.imports.items():
+            producers = {self.producer(name) for name in names}
+            graph[stack_name] = producers - {None, stack_name}
+
+        return graph
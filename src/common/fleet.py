@@ -0,0 +1,105 @@
+import os
+
+from common.build import write_stack
+from common.config import deep_merge, resolve_config
+
+STACK = "ecs_service"
+
+# Listener rule priorities go from 1 to 50000
+MAX_PRIORITY = 50000
+
+# Path pattern matching every request
+CATCH_ALL_PATH = "/*"
+
+# Target group names are limited to 32 characters
+MAX_TARGET_GROUP_NAME = 32
+
+
+def load_manifest(path):
+    # yaml or json, with an optional defaults block applied to every service
+    from cfn_flip import load
+
+    with open(path) as f:
+        manifest = load(f.read())[0]
+    if not manifest.get("services"):
+        raise ValueError(f"{path} has no services")
+
+    return manifest
+
+
+def fleet_configs(manifest, env):
+    # Yields (service_name, config) for every service of the manifest. Each
+    # config layers the ecs_service config of the environment, the manifest
+    # defaults and the service overrides, every service gets its own stack
+    # name and artifact unless it sets them. Listener rule priorities are
+    # set per service: each stack is deployed on its own, so a priority must
+    # not change when services are added or removed
+    base = resolve_config(STACK, env)
+    defaults = manifest.get("defaults", {})
+
+    services = {}
+    for service in manifest["services"]:
+        name = service.get("service_name")
+        if not name:
+            raise ValueError(f"Service without service_name in the manifest: {service}")
+        if name in services:
+            raise ValueError(f"Service {name} is listed twice in the manifest")
+        if "listener_rule_priority" not in service:
+            raise ValueError(f"Service {name} has no listener_rule_priority")
+        services[name] = service
+
+    taken = {}
+    for name, service in services.items():
+        priority = int(service["listener_rule_priority"])
+        if not 1 <= priority <= MAX_PRIORITY:
+            raise ValueError(
+                f"{name} listener rule priority {priority} is not between 1 and "
+                f"{MAX_PRIORITY}"
+            )
+        if priority in taken:
+            raise ValueError(
+                f"{name} and {taken[priority]} share listener rule priority "
+                f"{priority}"
+            )
+        taken[priority] = name
+
+    paths = {}
+    for name, service in services.items():
+        config = deep_merge(deep_merge(base, defaults), service)
+        config["stack_name"] = service.get("stack_name", f"{base['stack_name']}-{name}")
+        if "artifact_name" not in service:
+            config["artifact_name"] = f"{env}-{config['project_name']}-{name}.zip"
+
+        path = config["application_path_api"]
+        if path in paths:
+            raise ValueError(f"{name} and {paths[path]} both route {path}")
+        paths[path] = name
+        # A catch-all rule evaluated before another one would take its traffic
+        priority = int(service["listener_rule_priority"])
+        if path == CATCH_ALL_PATH and priority < max(taken):
+            raise ValueError(
+                f"{name} routes {path} with priority {priority}, before "
+                f"{taken[max(taken)]} ({max(taken)}): a catch-all needs the "
+                "highest priority number of the fleet"
+            )
+        if len(f"{env}-{name}") > MAX_TARGET_GROUP_NAME:
+            raise ValueError(
+                f"Target group name {env}-{name} is longer than "
+                f"{MAX_TARGET_GROUP_NAME} characters"
+            )
+
+        yield name, config
+
+
+def build_fleet(output_dir, manifest, env, fmt="yaml", cache=None):
+    # Templates are written one service at a time as
+    # <output_dir>/ecs_service-<service>.<fmt>, so memory does not grow with
+    # the size of the fleet. Returns {service: path}
+    os.makedirs(output_dir, exist_ok=True)
+
+    paths = {}
+    for name, config in fleet_configs(manifest, env):
+        path = os.path.join(output_dir, f"{STACK}-{name}.{fmt}")
+        paths[name] = write_stack(path, STACK, config, fmt, cache)
+
+    return paths
@@ -0,0 +1,100 @@
+from common.size import depends_on, find_references, resource_order
+
+# Rough creation times in seconds, only used to compare dependency chains
+RESOURCE_DURATIONS = {
+    "AWS::CloudFormation::Stack": 60,
+    "AWS::CloudFront::Distribution": 600,
+    "AWS::EC2::EIP": 5,
+    "AWS::EC2::InternetGateway": 15,
+    "AWS::EC2::NatGateway": 120,
+    "AWS::EC2::Route": 30,
+    "AWS::EC2::VPC": 15,
+    "AWS::EC2::VPCGatewayAttachment": 15,
+    "AWS::ECS::Service": 120,
+    "AWS::ElasticLoadBalancingV2::LoadBalancer": 180,
+    "AWS::IAM::Role": 15,
+    "AWS::S3::Bucket": 20,
+}
+DEFAULT_DURATION = 5
+
+
+def resource_graph(resources):
+    # Returns the implicit (Ref, Fn::GetAtt, Fn::Sub) and the explicit
+    # (DependsOn) dependencies of every resource
+    implicit = {}
+    explicit = {}
+    for name, resource in resources.items():
+        referenced = {ref for ref, _ in find_references(resource)}
+        implicit[name] = referenced & resources.keys() - {name}
+        explicit[name] = set(depends_on(resource))
+
+    return implicit, explicit
+
+
+def redundant_depends_on(resources):
+    # (resource, dependency) pairs of DependsOn entries already implied by a
+    # reference or by a chain of other dependencies
+    implicit, explicit = resource_graph(resources)
+    descendants = {}
+    for name in resource_order(resources):
+        descendants[name] = set()
+        for dependency in implicit[name] | explicit[name]:
+            descendants[name] |= descendants[dependency] | {dependency}
+
+    redundant = []
+    for name in sorted(resources):
+        for dependency in sorted(explicit[name]):
+            others = (implicit[name] | explicit[name]) - {dependency}
+            if dependency in implicit[name] or any(
+                dependency in descendants[other] for other in others
+            ):
+                redundant.append((name, dependency))
+
+    return redundant
+
+
+def prune_depends_on(t):
+    # Removes the redundant DependsOn entries from the resources of a
+    # troposphere Template, returns the removed pairs
+    from troposphere import encode_to_dict
+
+    if not any("DependsOn" in r.resource for r in t.resources.values()):
+        return []
+
+    redundant = redundant_depends_on(encode_to_dict(t.resources))
+    for name, dependency in redundant:
+        resource = t.resources[name].resource
+        remaining = [d for d in depends_on(resource) if d != dependency]
+        if remaining:
+            resource["DependsOn"] = remaining
+        else:
+            del resource["DependsOn"]
+
+    return redundant
+
+
+def critical_path(resources, durations=None):
+    # Longest chain of dependent resources weighted by their estimated
+    # creation time, returns the chain and its total in seconds
+    durations = {**RESOURCE_DURATIONS, **(durations or {})}
+    implicit, explicit = resource_graph(resources)
+
+    finish = {}
+    previous = {}
+    for name in resource_order(resources):
+        start = 0
+        for dependency in sorted(implicit[name] | explicit[name]):
+            if finish[dependency] > start:
+                start = finish[dependency]
+                previous[name] = dependency
+        duration = durations.get(resources[name].get("Type"), DEFAULT_DURATION)
+        finish[name] = start + duration
+
+    if not finish:
+        return [], 0
+    last = max(sorted(finish), key=finish.get)
+    path = [last]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+
+    return path[::-1], finish[last]
@@ -0,0 +1,103 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from common.exports import ExportIndex
+
+
+def dependency_graph(templates, nested=None):
+    # templates maps stack names to parsed templates, and nested to the lists
+    # of their nested stack templates. A stack depends on the stacks
+    # exporting the names it, or one of its nested stacks, imports
+    index = ExportIndex()
+    for stack_name, template in templates.items():
+        index.add(stack_name, template)
+        for child in (nested or {}).get(stack_name, []):
+            index.add(stack_name, child)
+
+    return index.dependencies()
+
+
+def topological_order(graph):
+    order = []
+    done = set()
+    while len(order) < len(graph):
+        ready = sorted(s for s, deps in graph.items() if s not in done and deps <= done)
+        if not ready:
+            cycle = sorted(set(graph) - done)
+            raise ValueError(f"Circular dependency between stacks {cycle}")
+        order.extend(ready)
+        done.update(ready)
+
+    return order
+
+
+def critical_path(graph, durations):
+    # Longest chain of dependent stacks weighted by their durations, returns
+    # the chain and its total duration
+    finish = {}
+    previous = {}
+    for stack_name in topological_order(graph):
+        start = 0
+        for dependency in graph[stack_name]:
+            if finish[dependency] > start:
+                start = finish[dependency]
+                previous[stack_name] = dependency
+        finish[stack_name] = start + durations.get(stack_name, 0)
+
+    if not finish:
+        return [], 0
+    last = max(finish, key=finish.get)
+    path = [last]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+
+    return path[::-1], finish[last]
+
+
+def deploy_stacks(graph, deploy, max_workers=None):
+    # Calls deploy(stack_name) for every stack of the graph as soon as the
+    # stacks it depends on are deployed, independent stacks run concurrently.
+    # Dependents of a failed stack are skipped. Returns a dict of results by
+    # stack with status (deployed, unchanged, failed or skipped), duration and
+    # error
+    topological_order(graph)
+
+    results = {}
+    pending = dict(graph)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for stack_name, deps in sorted(pending.items()):
+                failed = [d for d in deps if results.get(d, {}).get("error")]
+                if failed:
+                    results[stack_name] = {
+                        "status": "skipped",
+                        "duration": 0,
+                        "error": f"{', '.join(sorted(failed))} failed",
+                    }
+                    del pending[stack_name]
+                elif all(d in results for d in deps):
+                    running[executor.submit(timed, deploy, stack_name)] = stack_name
+                    del pending[stack_name]
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                results[running.pop(future)] = future.result()
+
+    return results
+
+
+def timed(deploy, stack_name):
+    start = time.monotonic()
+    try:
+        deployed = deploy(stack_name)
+    except Exception as e:
+        return {"status": "failed", "duration": time.monotonic() - start, "error": e}
+
+    return {
+        "status": "deployed" if deployed else "unchanged",
+        "duration": time.monotonic() - start,
+        "error": None,
+    }
@@ -1,5 +1,9 @@
+import re
+
 from troposphere import Parameter
 
+from common.size import MAX_PARAMETERS
+
 
 def add_parameters(template, dic):
 
@@ -10,3 +14,177 @@ def add_parameters(template, dic):
         ))
 
     return template
+
+
+# Parameter selecting the environment of a parameterized template
+ENV_PARAMETER = "Env"
+
+# Intrinsic functions whose arguments must stay literal, a difference inside
+# them is resolved by picking the whole function per environment
+LITERAL_FUNCTIONS = ("Ref", "Fn::GetAtt", "Fn::Sub", "Condition")
+
+
+def camel_case(parts):
+    return "".join(
+        word[:1].upper() + word[1:]
+        for part in parts
+        for word in re.split(r"[^A-Za-z0-9]+", str(part))
+    )
+
+
+def is_scalar(value):
+    return isinstance(value, (str, int, float, bool))
+
+
+def scalar(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def config_names(configs):
+    # Parameter names of the config values differing between environments,
+    # by their values in each environment
+    names = {}
+
+    def walk(values, path):
+        if all(isinstance(value, dict) for value in values):
+            for key in sorted(set.intersection(*(set(value) for value in values))):
+                walk([value[key] for value in values], path + [key])
+        elif all(is_scalar(value) for value in values):
+            key = tuple(scalar(value) for value in values)
+            if len(set(key)) > 1:
+                names.setdefault(key, camel_case(path))
+
+    walk(list(configs.values()), [])
+
+    return names
+
+
+def parameterize(templates, configs):
+    # Merges the templates rendered for each environment into a single one
+    # selecting its environment with the Env parameter. Scalars differing
+    # between environments become parameters, other differences are picked
+    # with Fn::If, and resources or outputs missing from some environments get
+    # a condition. Returns the merged template and the parameter values of
+    # every environment
+    envs = list(templates)
+    by_values = {tuple(envs): ENV_PARAMETER}
+    by_values.update(config_names(configs))
+    parameters = {ENV_PARAMETER: tuple(envs)}
+    conditions = {}
+
+    def condition(subset):
+        for env in subset:
+            conditions[f"Is{camel_case([env])}"] = {
+                "Fn::Equals": [{"Ref": ENV_PARAMETER}, env]
+            }
+        name = "Is" + "Or".join(camel_case([env]) for env in subset)
+        if len(subset) > 1:
+            conditions[name] = {
+                "Fn::Or": [{"Condition": f"Is{camel_case([env])}"} for env in subset]
+            }
+        return name
+
+    def parameter(values, path):
+        first = next(iter(values.values()))
+        key = tuple(scalar(values.get(env, first)) for env in envs)
+        name = by_values.get(key)
+        if name is None or parameters.get(name, key) != key:
+            base = name or camel_case(
+                p for p in path if p not in ("Resources", "Properties")
+            )
+            name, count = base, 1
+            while name in parameters:
+                count += 1
+                name = f"{base}{count}"
+        by_values[key] = name
+        parameters[name] = key
+        return {"Ref": name}
+
+    def choose(values):
+        subset = list(values)
+        value = values[subset[-1]]
+        for env in reversed(subset[:-1]):
+            value = {"Fn::If": [condition([env]), values[env], value]}
+        return value
+
+    def merge(values, path):
+        items = list(values.values())
+        if all(item == items[0] for item in items[1:]):
+            return items[0]
+        if all(isinstance(item, dict) for item in items) and not any(
+            len(item) == 1 and next(iter(item)) in LITERAL_FUNCTIONS for item in items
+        ):
+            merged = {}
+            for key in sorted(set().union(*items)):
+                subset = {env: item[key] for env, item in values.items() if key in item}
+                merged[key] = merge(subset, path + [key])
+                if len(subset) < len(values):
+                    merged[key] = {
+                        "Fn::If": [
+                            condition(list(subset)),
+                            merged[key],
+                            {"Ref": "AWS::NoValue"},
+                        ]
+                    }
+            return merged
+        if all(isinstance(item, list) for item in items) and (
+            len({len(item) for item in items}) == 1
+        ):
+            return [
+                merge({env: item[i] for env, item in values.items()}, path + [i])
+                for i in range(len(items[0]))
+            ]
+        if all(is_scalar(item) for item in items):
+            return parameter(values, path)
+        return choose(values)
+
+    def merge_section(section):
+        merged = {}
+        names = set().union(*(t.get(section, {}) for t in templates.values()))
+        for name in sorted(names):
+            subset = {
+                env: t[section][name]
+                for env, t in templates.items()
+                if name in t.get(section, {})
+            }
+            for key in ("Type", "DependsOn", "Condition"):
+                if len({repr(value.get(key)) for value in subset.values()}) > 1:
+                    raise ValueError(f"{key} of {name} differs between environments")
+            merged[name] = merge(subset, [section, name])
+            if len(subset) < len(templates):
+                if "Condition" in merged[name]:
+                    raise ValueError(f"{name} already has a condition")
+                merged[name]["Condition"] = condition(list(subset))
+        return merged
+
+    template = {}
+    for section in ("AWSTemplateFormatVersion", "Description", "Mappings"):
+        values = {env: t[section] for env, t in templates.items() if section in t}
+        if len({repr(value) for value in values.values()}) > 1:
+            raise ValueError(f"{section} differs between environments")
+        if values:
+            template[section] = next(iter(values.values()))
+    template["Resources"] = merge_section("Resources")
+    template["Outputs"] = merge_section("Outputs")
+
+    if len(parameters) > MAX_PARAMETERS:
+        raise ValueError(
+            f"{len(parameters)} values differ between environments, the "
+            f"parameter limit is {MAX_PARAMETERS}"
+        )
+    template["Parameters"] = {
+        name: {"Type": "String"} for name in parameters if name != ENV_PARAMETER
+    }
+    template["Parameters"][ENV_PARAMETER] = {
+        "Type": "String",
+        "AllowedValues": envs,
+        "Description": "Environment the stack is deployed for",
+    }
+    template["Conditions"] = conditions
+
+    return template, {
+        env: {name: values[i] for name, values in parameters.items()}
+        for i, env in enumerate(envs)
+    }
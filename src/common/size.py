@@ -0,0 +1,469 @@
+import heapq
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+
+from cfn_flip import dump_yaml, load
+
+# CloudFormation quotas
+INLINE_MAX_BYTES = 51200
+S3_MAX_BYTES = 1024 * 1024
+MAX_RESOURCES = 500
+MAX_PARAMETERS = 200
+MAX_OUTPUTS = 200
+
+# Share of the quotas the resources of a nested stack may use, the rest is
+# kept for the parameters and outputs wiring it to the other stacks
+CHUNK_RATIO = 0.8
+
+SUB_VARIABLE = re.compile(r"\$\{([^!}][^}]*)\}")
+
+# Parameter of the nested stacks taking the name of the parent stack, which
+# stands for AWS::StackName in them so names and exports stay the same
+PARENT_STACK_NAME = "ParentStackName"
+
+
+@contextmanager
+def lifted_template_limits():
+    # troposphere refuses a 501st resource or a 201st output while the
+    # template is being generated. The limits are checked on the rendered
+    # template instead, where a template over them can still be split into
+    # nested stacks
+    import troposphere
+
+    limits = troposphere.MAX_RESOURCES, troposphere.MAX_OUTPUTS
+    troposphere.MAX_RESOURCES = troposphere.MAX_OUTPUTS = sys.maxsize
+    try:
+        yield
+    finally:
+        troposphere.MAX_RESOURCES, troposphere.MAX_OUTPUTS = limits
+
+
+def minify(template):
+    return json.dumps(template, sort_keys=True, separators=(",", ":"))
+
+
+def size_report(template, size, inline=False):
+    resources = len(template.get("Resources", {}))
+    outputs = len(template.get("Outputs", {}))
+    max_bytes = INLINE_MAX_BYTES if inline else S3_MAX_BYTES
+
+    return {
+        "bytes": size,
+        "max_bytes": max_bytes,
+        "bytes_headroom": max_bytes - size,
+        "resources": resources,
+        "max_resources": MAX_RESOURCES,
+        "resources_headroom": MAX_RESOURCES - resources,
+        "outputs": outputs,
+        "max_outputs": MAX_OUTPUTS,
+        "outputs_headroom": MAX_OUTPUTS - outputs,
+    }
+
+
+def exceeds_limits(report):
+    return (
+        report["bytes_headroom"] < 0
+        or report["resources_headroom"] < 0
+        or report["outputs_headroom"] < 0
+    )
+
+
+def find_references(value):
+    # Yields (name, attribute) for every Ref, Fn::GetAtt and Fn::Sub variable,
+    # attribute is None for a Ref
+    if isinstance(value, list):
+        for item in value:
+            yield from find_references(item)
+    elif isinstance(value, dict):
+        if "Ref" in value:
+            yield value["Ref"], None
+        elif "Fn::GetAtt" in value:
+            name, attribute = get_att(value["Fn::GetAtt"])
+            yield name, attribute
+        elif "Fn::Sub" in value:
+            string, variables = sub_parts(value["Fn::Sub"])
+            for variable in SUB_VARIABLE.findall(string):
+                name, _, attribute = variable.partition(".")
+                if name not in variables:
+                    yield name, attribute or None
+            yield from find_references(list(variables.values()))
+        else:
+            yield from find_references(list(value.values()))
+
+
+def replace_references(value, replace):
+    # replace(name, attribute) returns the expression that takes the place of
+    # the reference, or None to keep it
+    if isinstance(value, list):
+        return [replace_references(item, replace) for item in value]
+    if not isinstance(value, dict):
+        return value
+
+    if "Ref" in value:
+        return replace(value["Ref"], None) or value
+    if "Fn::GetAtt" in value:
+        return replace(*get_att(value["Fn::GetAtt"])) or value
+    if "Fn::Sub" in value:
+        string, variables = sub_parts(value["Fn::Sub"])
+        variables = {k: replace_references(v, replace) for k, v in variables.items()}
+
+        def replace_variable(match):
+            name, _, attribute = match.group(1).partition(".")
+            expression = None
+            if name not in variables:
+                expression = replace(name, attribute or None)
+            if expression is None:
+                return match.group(0)
+            variable = re.sub(r"[^A-Za-z0-9]", "", match.group(1)) + "Value"
+            variables[variable] = expression
+            return "${" + variable + "}"
+
+        string = SUB_VARIABLE.sub(replace_variable, string)
+        return {"Fn::Sub": [string, variables] if variables else string}
+
+    return {k: replace_references(v, replace) for k, v in value.items()}
+
+
+def get_att(value):
+    if isinstance(value, str):
+        return tuple(value.split(".", 1))
+    return value[0], value[1]
+
+
+def sub_parts(value):
+    if isinstance(value, str):
+        return value, {}
+    return value[0], dict(value[1])
+
+
+def depends_on(resource):
+    value = resource.get("DependsOn", [])
+    return [value] if isinstance(value, str) else list(value)
+
+
+def resource_order(resources):
+    # Topological order of the resources, every resource comes after the
+    # resources it references or depends on
+    dependencies = {}
+    for name, resource in resources.items():
+        referenced = {ref for ref, _ in find_references(resource)}
+        referenced.update(depends_on(resource))
+        dependencies[name] = referenced & resources.keys() - {name}
+
+    remaining = {name: len(deps) for name, deps in dependencies.items()}
+    dependents = {name: [] for name in resources}
+    for name, deps in dependencies.items():
+        for dependency in deps:
+            dependents[dependency].append(name)
+
+    order = []
+    ready = [name for name, count in remaining.items() if count == 0]
+    heapq.heapify(ready)
+    while ready:
+        name = heapq.heappop(ready)
+        order.append(name)
+        for dependent in dependents[name]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                heapq.heappush(ready, dependent)
+
+    if len(order) != len(resources):
+        cycle = sorted(resources.keys() - set(order))
+        raise ValueError(f"Circular dependency between resources {cycle}")
+
+    return order
+
+
+def movable_outputs(template):
+    # Outputs that only reference a single resource, besides parameters and
+    # pseudo parameters, by output name. They can move to the nested stack of
+    # that resource
+    resources = template["Resources"]
+    parameters = template.get("Parameters", {})
+    movable = {}
+    for key, output in template.get("Outputs", {}).items():
+        refs = {ref for ref, _ in find_references(output)}
+        owners = refs & resources.keys()
+        others = refs - owners
+        if len(owners) == 1 and all(
+            ref in parameters or ref.startswith("AWS::") for ref in others
+        ):
+            movable[key] = owners.pop()
+
+    return movable
+
+
+def chunk_resources(
+    template, max_bytes, max_resources, max_parameters, max_outputs, moved=None
+):
+    # Fills the chunks in dependency order, so references only point to
+    # resources of the same or of an earlier chunk. Besides bytes and
+    # resources, a chunk is bounded by the parameters its references to
+    # earlier chunks need, and by the outputs its resources may need. The
+    # outputs are counted for every attribute referenced from another
+    # resource or a parent output, whichever chunk that ends up in, and for
+    # the moved outputs, a dict of resources by output name which go to the
+    # chunk of their resource
+    resources = template["Resources"]
+    parameters = template.get("Parameters", {})
+    moved = moved or {}
+
+    references = {}
+    exported = {name: set() for name in resources}
+    for name, resource in resources.items():
+        references[name] = set(find_references(resource))
+        for ref, attribute in references[name]:
+            if ref in resources and ref != name:
+                exported[ref].add(attribute)
+    local_outputs = {name: 0 for name in resources}
+    for key, output in template.get("Outputs", {}).items():
+        if key in moved:
+            local_outputs[moved[key]] += 1
+            references[moved[key]].update(find_references(output))
+            continue
+        for ref, attribute in find_references(output):
+            if ref in resources:
+                exported[ref].add(attribute)
+    # Every chunk gets the conditions, and so the parameters they reference
+    base_parameters = {
+        ref
+        for ref, _ in find_references(template.get("Conditions", {}))
+        if ref in parameters
+    }
+
+    owner = {}
+
+    def needed_parameters(name, index):
+        needed = set()
+        for ref, attribute in references[name]:
+            if ref in parameters:
+                needed.add(ref)
+            elif ref == "AWS::StackName":
+                needed.add(PARENT_STACK_NAME)
+            elif ref in owner and owner[ref] != index:
+                needed.add(output_name(ref, attribute))
+        return needed
+
+    chunks = [[]]
+    size = 0
+    chunk_parameters = set(base_parameters)
+    outputs = 0
+    for name in resource_order(resources):
+        resource_size = len(minify({name: resources[name]}).encode())
+        resource_outputs = len(exported[name]) + local_outputs[name]
+        new_parameters = needed_parameters(name, len(chunks) - 1)
+        if chunks[-1] and (
+            size + resource_size > max_bytes
+            or len(chunks[-1]) >= max_resources
+            or len(chunk_parameters | new_parameters) > max_parameters
+            or outputs + resource_outputs > max_outputs
+        ):
+            chunks.append([])
+            size = 0
+            chunk_parameters = set(base_parameters)
+            outputs = 0
+            new_parameters = needed_parameters(name, len(chunks) - 1)
+        chunks[-1].append(name)
+        owner[name] = len(chunks) - 1
+        size += resource_size
+        chunk_parameters |= new_parameters
+        outputs += resource_outputs
+
+    return chunks
+
+
+def output_name(name, attribute):
+    return re.sub(r"[^A-Za-z0-9]", "", name + (attribute or "")) + (
+        "Ref" if attribute is None else ""
+    )
+
+
+def split_template(template, name, template_url, inline=False):
+    # Splits the resources of the template into nested stacks. Returns the
+    # parent template, keeping the parameters and outputs (and so exports) of
+    # the original one, and a dict of child templates by file name, to be
+    # uploaded under template_url. When the original outputs are over the
+    # limit, the ones that only reference a single resource are moved to the
+    # nested stack of that resource, with their exports
+    max_bytes = int((INLINE_MAX_BYTES if inline else S3_MAX_BYTES) * CHUNK_RATIO)
+    max_resources = int(MAX_RESOURCES * CHUNK_RATIO)
+
+    resources = template["Resources"]
+    parameters = template.get("Parameters", {})
+    moved = {}
+    if len(template.get("Outputs", {})) > MAX_OUTPUTS:
+        moved = movable_outputs(template)
+    chunks = chunk_resources(
+        template, max_bytes, max_resources, MAX_PARAMETERS, MAX_OUTPUTS, moved
+    )
+    owner = {
+        resource: index for index, chunk in enumerate(chunks) for resource in chunk
+    }
+
+    stack_names = [
+        f"{name.title().replace('_', '')}Stack{i + 1}" for i in range(len(chunks))
+    ]
+    children = [
+        {
+            "AWSTemplateFormatVersion": "2010-09-09",
+            "Parameters": {},
+            "Resources": {},
+            "Outputs": {},
+        }
+        for _ in chunks
+    ]
+    stack_parameters = [{} for _ in chunks]
+    stack_depends_on = [set() for _ in chunks]
+
+    def export_from(index, resource, attribute):
+        # Outputs a value of a child stack, returns the parent expression
+        out = output_name(resource, attribute)
+        value = {"Ref": resource}
+        if attribute is not None:
+            value = {"Fn::GetAtt": [resource, attribute]}
+        children[index]["Outputs"][out] = {"Value": value}
+        return out, {"Fn::GetAtt": [stack_names[index], f"Outputs.{out}"]}
+
+    def child_replace(index):
+        def replace(resource, attribute):
+            if resource in parameters:
+                children[index]["Parameters"][resource] = parameters[resource]
+                stack_parameters[index][resource] = {"Ref": resource}
+                return None
+            if resource == "AWS::StackName":
+                children[index]["Parameters"][PARENT_STACK_NAME] = {"Type": "String"}
+                stack_parameters[index][PARENT_STACK_NAME] = {"Ref": resource}
+                return {"Ref": PARENT_STACK_NAME}
+            if resource not in owner or owner[resource] == index:
+                return None
+            out, value = export_from(owner[resource], resource, attribute)
+            children[index]["Parameters"][out] = {"Type": "String"}
+            stack_parameters[index][out] = value
+            return {"Ref": out}
+
+        return replace
+
+    for section in ("Mappings", "Conditions"):
+        if section in template:
+            for child in children:
+                child[section] = template[section]
+
+    for index, chunk in enumerate(chunks):
+        replace = child_replace(index)
+        for condition in template.get("Conditions", {}).values():
+            replace_references(condition, replace)
+        for resource_name in chunk:
+            resource = dict(resources[resource_name])
+            local, remote = [], []
+            for dependency in depends_on(resource):
+                if owner.get(dependency) == index:
+                    local.append(dependency)
+                else:
+                    remote.append(dependency)
+            resource.pop("DependsOn", None)
+            if local:
+                resource["DependsOn"] = local
+            stack_depends_on[index].update(stack_names[owner[r]] for r in remote)
+            children[index]["Resources"][resource_name] = replace_references(
+                resource, replace
+            )
+        for key, output in template.get("Outputs", {}).items():
+            if owner.get(moved.get(key)) == index:
+                children[index]["Outputs"][key] = replace_references(output, replace)
+
+    def parent_replace(resource, attribute):
+        if resource not in owner:
+            return None
+        return export_from(owner[resource], resource, attribute)[1]
+
+    outputs = {
+        key: replace_references(output, parent_replace)
+        for key, output in template.get("Outputs", {}).items()
+        if key not in moved
+    }
+
+    parent = {
+        key: value
+        for key, value in template.items()
+        if key not in ("Resources", "Outputs")
+    }
+    parent["Resources"] = {}
+    for index, child in enumerate(children):
+        for section in ("Parameters", "Outputs"):
+            limit = MAX_PARAMETERS if section == "Parameters" else MAX_OUTPUTS
+            if len(child[section]) > limit:
+                raise ValueError(
+                    f"{stack_names[index]} needs {len(child[section])} "
+                    f"{section.lower()}, the limit is {limit}"
+                )
+            if not child[section]:
+                del child[section]
+        stack = {
+            "Type": "AWS::CloudFormation::Stack",
+            "Properties": {
+                "TemplateURL": f"{template_url.rstrip('/')}/{name}-{index + 1}.json",
+            },
+        }
+        if stack_parameters[index]:
+            stack["Properties"]["Parameters"] = stack_parameters[index]
+        # The stacks it takes outputs from are dependencies already
+        depends = stack_depends_on[index] - {
+            ref for ref, _ in find_references(stack_parameters[index])
+        }
+        if depends:
+            stack["DependsOn"] = sorted(depends)
+        parent["Resources"][stack_names[index]] = stack
+    if outputs:
+        parent["Outputs"] = outputs
+
+    return parent, {
+        f"{name}-{index + 1}.json": child for index, child in enumerate(children)
+    }
+
+
+def optimize_template(path, name, minified=False, template_url=None, inline=False):
+    # Output stage of a rendered template: rewrites it as minified json and,
+    # when it is over the limits and template_url is set, splits it into
+    # nested stacks written next to it. A template only over the byte limit is
+    # minified first, and only split when that is not enough. Returns the size
+    # and headroom report of the template as written, and a dict of reports of
+    # the nested templates by path
+    with open(path) as f:
+        body = f.read()
+    template, fmt = load(body)
+    if minified:
+        body = minify(template)
+    report = size_report(template, len(body.encode()), inline)
+
+    if template_url and exceeds_limits(report) and not minified:
+        minified_report = size_report(template, len(minify(template).encode()), inline)
+        if not exceeds_limits(minified_report):
+            minified = True
+            body = minify(template)
+            report = minified_report
+
+    nested = {}
+    if template_url and exceeds_limits(report):
+        template, children = split_template(template, name, template_url, inline)
+        for file_name, child in children.items():
+            nested_path = os.path.join(os.path.dirname(path), file_name)
+            nested_body = minify(child)
+            with open(nested_path, "w") as f:
+                f.write(nested_body)
+            # Nested templates are always given by URL
+            nested[nested_path] = size_report(child, len(nested_body.encode()))
+        if minified or fmt == "json":
+            body = minify(template)
+        else:
+            body = dump_yaml(template)
+        report = size_report(template, len(body.encode()), inline)
+    elif not minified:
+        return report, nested
+
+    with open(path, "w") as f:
+        f.write(body)
+
+    return report, nested
@@ -0,0 +1,277 @@
+import hashlib
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from botocore.exceptions import ClientError
+
+from common.assets import (
+    ASSETS_DIR,
+    COMPRESSIBLE,
+    ENCODINGS,
+    PAGES,
+    SUPERSEDED_PREFIX,
+    SUPERSEDED_TAG,
+)
+
+# md5 of the uploaded file, for objects whose ETag is not one (multipart or
+# KMS encrypted uploads)
+MD5_METADATA = "md5"
+
+# html pages must be revalidated so a publish shows up at once, other files
+# are cached by the browsers and CloudFront
+HTML_CACHE_CONTROL = "no-cache"
+DEFAULT_CACHE_CONTROL = "public, max-age=86400"
+# Fingerprinted assets never change under the same key
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+# Above this many paths a single wildcard invalidation is used instead
+MAX_INVALIDATION_PATHS = 1000
+
+
+def content_encoding(key):
+    # Compressed variant of a fingerprinted asset, see common.assets
+    if not key.startswith(ASSETS_DIR + "/"):
+        return None
+    for encoding, suffix in ENCODINGS.items():
+        if key.endswith(suffix) and key.removesuffix(suffix).endswith(COMPRESSIBLE):
+            return encoding
+
+    return None
+
+
+def content_type(key):
+    # Variants have the type of the file they compress
+    if content_encoding(key) is not None:
+        key = os.path.splitext(key)[0]
+    if key.endswith(".ico"):
+        return "image/x-icon"
+    guessed, _ = mimetypes.guess_type(key)
+    if guessed is not None and guessed.startswith("text/"):
+        return f"{guessed}; charset=utf-8"
+
+    return guessed or DEFAULT_CONTENT_TYPE
+
+
+def cache_control(key):
+    if key.endswith(".html"):
+        return HTML_CACHE_CONTROL
+    if key.startswith(ASSETS_DIR + "/"):
+        return ASSET_CACHE_CONTROL
+
+    return DEFAULT_CACHE_CONTROL
+
+
+def file_md5(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def local_files(root, prefix=""):
+    # Object keys of the files under root, hidden files (.DS_Store...) are
+    # left out
+    files = {}
+    for directory, dirs, names in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            path = os.path.join(directory, name)
+            key = os.path.relpath(path, root).replace(os.sep, "/")
+            files[prefix + key] = path
+
+    return files
+
+
+def remote_etags(s3, bucket, prefix=""):
+    etags = {}
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if not obj["Key"].startswith(SUPERSEDED_PREFIX):
+                etags[obj["Key"]] = obj["ETag"].strip('"')
+
+    return etags
+
+
+def superseded_keys(s3, bucket, prefix=""):
+    keys = set()
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=SUPERSEDED_PREFIX + prefix):
+        for obj in page.get("Contents", []):
+            keys.add(obj["Key"].removeprefix(SUPERSEDED_PREFIX))
+
+    return keys
+
+
+def remote_md5(s3, bucket, key):
+    try:
+        response = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+    return response.get("Metadata", {}).get(MD5_METADATA)
+
+
+def upload_file(s3, bucket, key, path, digest):
+    headers = dict(ContentType=content_type(key), CacheControl=cache_control(key))
+    if content_encoding(key) is not None:
+        headers["ContentEncoding"] = content_encoding(key)
+    with open(path, "rb") as f:
+        s3.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=f,
+            Metadata={MD5_METADATA: digest},
+            **headers,
+        )
+
+
+def supersede(s3, bucket, key):
+    # Copies the object onto itself with the superseded tag, the copy gets a
+    # new creation date so the lifecycle rule expires it counting from now
+    head = s3.head_object(Bucket=bucket, Key=key)
+    headers = dict(
+        ContentType=head.get("ContentType", DEFAULT_CONTENT_TYPE),
+        CacheControl=head.get("CacheControl", cache_control(key)),
+    )
+    if head.get("ContentEncoding"):
+        headers["ContentEncoding"] = head["ContentEncoding"]
+    s3.copy_object(
+        Bucket=bucket,
+        Key=key,
+        CopySource={"Bucket": bucket, "Key": key},
+        MetadataDirective="REPLACE",
+        Metadata=head.get("Metadata", {}),
+        TaggingDirective="REPLACE",
+        Tagging="=".join(SUPERSEDED_TAG),
+        **headers,
+    )
+    s3.put_object(
+        Bucket=bucket,
+        Key=SUPERSEDED_PREFIX + key,
+        Body=b"",
+        Tagging="=".join(SUPERSEDED_TAG),
+    )
+
+
+def delete_keys(s3, bucket, keys):
+    for start in range(0, len(keys), 1000):
+        batch = keys[start:][:1000]
+        s3.delete_objects(
+            Bucket=bucket, Delete={"Objects": [{"Key": key} for key in batch]}
+        )
+
+
+def invalidate(cloudfront, distribution_id, keys):
+    # One invalidation for every changed key, returns its id
+    paths = sorted("/" + quote(key) for key in keys)
+    if len(paths) > MAX_INVALIDATION_PATHS:
+        paths = ["/*"]
+    reference = hashlib.sha256("\n".join(paths).encode()).hexdigest()[:32]
+    response = cloudfront.create_invalidation(
+        DistributionId=distribution_id,
+        InvalidationBatch={
+            "Paths": {"Quantity": len(paths), "Items": paths},
+            "CallerReference": f"{reference}-{time.time_ns()}",
+        },
+    )
+
+    return response["Invalidation"]["Id"]
+
+
+def sync_content(
+    s3,
+    bucket,
+    root,
+    prefix="",
+    cloudfront=None,
+    distribution_id=None,
+    delete=False,
+    jobs=8,
+    dry_run=False,
+):
+    # Uploads the files under root whose md5 differs from the object in the
+    # bucket, jobs at a time, and invalidates the replaced keys in a single
+    # CloudFront invalidation when distribution_id is set. The html pages are
+    # only uploaded once everything they reference is. With delete, objects
+    # without a local file are removed, except fingerprinted assets which
+    # cached pages may still load: they are tagged as superseded and expired
+    # by the bucket lifecycle rule. Returns the uploaded, deleted and
+    # superseded keys, the number of unchanged files and the invalidation id
+    files = local_files(root, prefix)
+    etags = remote_etags(s3, bucket, prefix)
+    assets_prefix = f"{prefix}{ASSETS_DIR}/"
+    superseded_before = superseded_keys(s3, bucket, assets_prefix)
+
+    def changed(key):
+        # Returns (upload, replaced, digest). A superseded asset published
+        # again is uploaded to drop its tag, but was never replaced
+        digest = file_md5(files[key])
+        if key not in etags:
+            return True, False, digest
+        # The ETag is not the md5 of the content for multipart and KMS
+        # encrypted objects, the md5 stored at upload is checked instead
+        if etags[key] != digest and remote_md5(s3, bucket, key) != digest:
+            return True, True, digest
+        if key in superseded_before:
+            return True, False, digest
+        return False, False, digest
+
+    removed = sorted(etags.keys() - files.keys()) if delete else []
+    stale_assets = [key for key in removed if key.startswith(assets_prefix)]
+    deletes = [key for key in removed if not key.startswith(assets_prefix)]
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        changes = dict(zip(files, executor.map(changed, files)))
+        uploads = sorted(key for key, (upload, _, _) in changes.items() if upload)
+        replaced = [key for key in uploads if changes[key][1]]
+        # Superseded assets keep their tag, copying them again would push
+        # their expiry back
+        superseded = [key for key in stale_assets if key not in superseded_before]
+        republished = [
+            SUPERSEDED_PREFIX + key for key in uploads if key in superseded_before
+        ]
+        if not dry_run:
+            pages = [key for key in uploads if key.endswith(PAGES)]
+            for batch in (
+                [key for key in uploads if not key.endswith(PAGES)],
+                pages,
+            ):
+                list(
+                    executor.map(
+                        lambda key: upload_file(
+                            s3, bucket, key, files[key], changes[key][2]
+                        ),
+                        batch,
+                    )
+                )
+            list(executor.map(lambda key: supersede(s3, bucket, key), superseded))
+
+    if not dry_run:
+        delete_keys(s3, bucket, deletes + republished)
+
+    # New keys cannot be cached yet, only replaced and deleted ones are
+    # invalidated. Superseded assets are still served as they were
+    stale = replaced + deletes
+    invalidation = None
+    if distribution_id and stale and not dry_run:
+        invalidation = invalidate(cloudfront, distribution_id, stale)
+
+    return {
+        "uploaded": uploads,
+        "deleted": deletes,
+        "superseded": superseded,
+        "unchanged": len(files) - len(uploads),
+        "invalidation": invalidation,
+    }
@@ -0,0 +1,106 @@
+import json
+import os
+from contextlib import contextmanager
+
+import cfn_flip
+
+
+def template_sections(t):
+    # Same sections as Template.to_dict, without encoding them up front
+    sections = {
+        "AWSTemplateFormatVersion": t.version,
+        "Conditions": t.conditions,
+        "Description": t.description,
+        "Globals": t.globals,
+        "Mappings": t.mappings,
+        "Metadata": t.metadata,
+        "Outputs": t.outputs,
+        "Parameters": t.parameters,
+        "Rules": t.rules,
+        "Transform": t.transform,
+    }
+    sections = {key: value for key, value in sections.items() if value}
+    sections["Resources"] = t.resources
+
+    return dict(sorted(sections.items()))
+
+
+def indent(text, prefix):
+    # Prefixes every line but the first one, which follows a key
+    return text.replace("\n", "\n" + prefix)
+
+
+def write_json(t, stream):
+    # Same output as Template.to_json(), each entry of a section is encoded
+    # and written on its own. troposphere is imported here so replace_file
+    # does not load it on a cached build
+    from troposphere import encode_to_dict
+
+    stream.write("{")
+    for i, (key, value) in enumerate(template_sections(t).items()):
+        stream.write(",\n" if i else "\n")
+        stream.write(f" {json.dumps(key)}: ")
+        if not isinstance(value, dict) or not value:
+            stream.write(
+                indent(json.dumps(encode_to_dict(value), indent=1, sort_keys=True), " ")
+            )
+            continue
+        stream.write("{")
+        for j, name in enumerate(sorted(value)):
+            stream.write(",\n" if j else "\n")
+            entry = json.dumps(encode_to_dict(value[name]), indent=1, sort_keys=True)
+            stream.write(f"  {json.dumps(name)}: {indent(entry, '  ')}")
+        stream.write("\n }")
+    stream.write("\n}")
+
+
+def write_yaml(t, stream):
+    # Each entry of a section is converted on its own and indented under its
+    # section key, long strings may wrap at other columns than with to_yaml
+    from troposphere import encode_to_dict
+
+    for key, value in template_sections(t).items():
+        if not isinstance(value, dict) or not value:
+            stream.write(to_yaml({key: encode_to_dict(value)}))
+            continue
+        stream.write(f"{key}:\n")
+        for name in sorted(value):
+            entry = to_yaml({name: encode_to_dict(value[name])})
+            stream.writelines(
+                "  " + line if line.strip() else line
+                for line in entry.splitlines(keepends=True)
+            )
+
+
+def to_yaml(data):
+    return cfn_flip.to_yaml(json.dumps(data, sort_keys=True))
+
+
+def write_template(t, stream, fmt="yaml"):
+    if fmt == "yaml":
+        write_yaml(t, stream)
+    elif fmt == "json":
+        write_json(t, stream)
+    else:
+        raise ValueError(f"Unknown format {fmt}, expected yaml or json")
+
+
+@contextmanager
+def replace_file(path):
+    # Yields a stream to a file next to the destination, renamed into place
+    # once written, so a reader never sees a partial template
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_template_file(t, path, fmt="yaml"):
+    with replace_file(path) as f:
+        write_template(t, f, fmt)
+
+    return path
@@ -6,5 +6,18 @@ config = {
                                'PYTHON_ENV environment variable for'
                                'ECS fargate.',
     'project_name': 'demo-ecs-fargate',
-    'network_stack_name': 'ansible-demo-network'
+    'stack_name': 'ansible-demo-ecs-fargate',
+    'network_stack_name': 'ansible-demo-network',
+    # ALB attributes, idle_timeout in seconds. http2 is between the clients
+    # and the ALB, the target groups set their own protocol version
+    'load_balancer': {
+        'idle_timeout': 60,
+        'http2': True
+    },
+    # Capacity providers of the cluster, and the strategy of the services
+    # that do not set capacity_provider_strategy
+    'capacity_providers': ['FARGATE', 'FARGATE_SPOT'],
+    'default_capacity_provider_strategy': [
+        {'capacity_provider': 'FARGATE', 'base': 0, 'weight': 1}
+    ]
 }
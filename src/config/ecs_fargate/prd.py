@@ -1,3 +1,6 @@
 config = {
-    'test_var': 'testprod'
-}
\ No newline at end of file
+    'tags': {
+        'ProjectName': 'demo-troposphere-ecs-fargate',
+        'env': 'prd'
+    }
+}
@@ -6,11 +6,70 @@ config = {
                                'PYTHON_ENV environment variable for'
                                'ECS service.',
     'project_name': 'demo-ecs-service',
+    'stack_name': 'ansible-demo-ecs-service',
     'service_name': 'devops-api',
     'network_stack_name': 'ansible-demo-network',
     'ecs_stack_name': 'ansible-demo-ecs-fargate',
     'tg_health_check_path': '/health',
     'application_path_api': '/*',
+    'listener_rule_priority': '1',
+    # Image the tasks start from on the first deploy, while the repository is
+    # still empty, e.g. a placeholder answering the health check on
+    # container_port. None runs the latest image of the repository
+    'bootstrap_image': None,
+    # Command of the bootstrap image only. None runs container_command, an
+    # empty string the command of the image. It stays in the task definition
+    # the pipeline deploys, until a deploy without bootstrap_image
+    'bootstrap_command': None,
+    # X86_64 or ARM64 (Graviton) tasks, built on a CodeBuild environment of
+    # the same architecture. multi_arch_build builds the image for both
+    'cpu_architecture': 'X86_64',
+    'multi_arch_build': False,
+    # Image builds. cache is local, s3 or None, registry_cache passes the
+    # BuildKit cache reference in the service repository to the buildspec
+    'codebuild': {
+        'compute_type': 'BUILD_GENERAL1_SMALL',
+        'cache': 'local',
+        'local_cache_modes': ['LOCAL_DOCKER_LAYER_CACHE', 'LOCAL_SOURCE_CACHE'],
+        'registry_cache': True
+    },
+    # Target group tuning, durations in seconds. protocol_version HTTP2 and
+    # GRPC need an HTTPS listener, and the cluster only has an HTTP one
+    'target_group': {
+        'protocol_version': 'HTTP1',
+        'load_balancing_algorithm': 'least_outstanding_requests',
+        'deregistration_delay': 30,
+        'slow_start': 0,
+        'health_check': {
+            'interval': 10,
+            'timeout': 5,
+            'healthy_threshold': 2,
+            'unhealthy_threshold': 3,
+            'matcher': '200-299'
+        }
+    },
     'artifact_store': 'demo-artifact-store',
-    'artifact_name': 'dev-demo-ecs-service.zip'
+    'artifact_name': 'dev-demo-ecs-service.zip',
+    # Appended to the ECS service name, changing it replaces the service.
+    # Services created with a LaunchType need it once to move to the
+    # capacity providers
+    'service_name_suffix': None,
+    # Capacity providers the tasks run on, they must be associated with the
+    # cluster. The base runs on the provider setting it, the tasks over it
+    # are split by weight
+    'capacity_provider_strategy': [
+        {'capacity_provider': 'FARGATE', 'base': 0, 'weight': 1}
+    ],
+    # Application Auto Scaling of the service desired count, None keeps a
+    # fixed container_desired_tasks_count. Targets left to None get no policy
+    'autoscaling': {
+        'min_capacity': 1,
+        'max_capacity': 2,
+        'cpu_target': 70,
+        'memory_target': None,
+        'requests_per_target': None,
+        'scale_in_cooldown': 300,
+        'scale_out_cooldown': 60,
+        'scheduled_actions': []
+    }
 }
@@ -7,4 +7,13 @@ config = {
     "container_desired_tasks_count": "1",
     "env": "dev",
     "tags": {"ProjectName": "demo-troposphere-ecs-service", "env": "dev"},
+    # Spot interruptions are fine in dev
+    "capacity_provider_strategy": [
+        {"capacity_provider": "FARGATE_SPOT", "base": 0, "weight": 1}
+    ],
+    # Fast rollouts, tasks are replaced without waiting for long requests
+    "target_group": {
+        "deregistration_delay": 5,
+        "health_check": {"interval": 5, "timeout": 2},
+    },
 }
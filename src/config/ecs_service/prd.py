@@ -1,3 +1,42 @@
 config = {
-    'test_var': 'testprod'
-}
\ No newline at end of file
+    # Container Definitions
+    "container_cpu": "512",
+    "container_memory": "1024",
+    "container_port": "8080",
+    "container_command": "python /run.py",
+    "container_desired_tasks_count": "2",
+    "env": "prd",
+    "artifact_name": "prd-demo-ecs-service.zip",
+    "tags": {"ProjectName": "demo-troposphere-ecs-service", "env": "prd"},
+    "codebuild": {"compute_type": "BUILD_GENERAL1_MEDIUM"},
+    # The autoscaling floor runs on demand, the tasks scaled out over it are
+    # split between on demand and Spot
+    "capacity_provider_strategy": [
+        {"capacity_provider": "FARGATE", "base": 2, "weight": 1},
+        {"capacity_provider": "FARGATE_SPOT", "base": 0, "weight": 1},
+    ],
+    # Long requests get a minute to complete before a task is stopped. Slow
+    # start is left off, it only works with round_robin
+    "target_group": {"deregistration_delay": 60},
+    "autoscaling": {
+        "min_capacity": 2,
+        "max_capacity": 10,
+        "memory_target": 75,
+        "requests_per_target": 1000,
+        # Raise the floor ahead of the working day, lower it after
+        "scheduled_actions": [
+            {
+                "name": "business-hours",
+                "schedule": "cron(0 7 ? * MON-FRI *)",
+                "min_capacity": 4,
+                "max_capacity": 10,
+            },
+            {
+                "name": "off-hours",
+                "schedule": "cron(0 20 ? * MON-FRI *)",
+                "min_capacity": 2,
+                "max_capacity": 10,
+            },
+        ],
+    },
+}
@@ -5,5 +5,6 @@ config = {
                                'different vars according to the'
                                'PYTHON_ENV environment variable for'
                                'network resources creation.',
-    'project_name': 'demo-network'
+    'project_name': 'demo-network',
+    'stack_name': 'ansible-demo-network'
 }
@@ -1,7 +1,11 @@
 config = {
     'vpc_cidr_block': '10.0.0.0/16',
-    'public_subnet_cidr_blocks': ['10.0.0.0/24', '10.0.1.0/24'],
-    'private_subnet_cidr_blocks': ['10.0.2.0/24', '10.0.3.0/24'],
+    # Subnet blocks are planned from the VPC block, one per tier and AZ.
+    # Set <tier>_subnet_cidr_blocks to pin them instead
+    'subnet_tiers': [
+        {'name': 'public', 'public': True, 'prefix_length': 24},
+        {'name': 'private', 'public': False, 'prefix_length': 24},
+    ],
     'availability_zones': ['us-east-1a', 'us-east-1b'],
     'tags': {
         'Name': 'demo-network1',
@@ -1,13 +1,9 @@
 import os
 
 def get_env(var, default=None):
-    return os.environ[var] or default
+    return os.environ.get(var) or default
 
-# Check if environment variable PYTHON_ENV is set
-
-if "PYTHON_ENV" in os.environ:
-    pass
 
 config = {
     'env': get_env('PYTHON_ENV')
-}
\ No newline at end of file
+}
@@ -1,3 +1,15 @@
 config = {
-    'test_var': 'testprod'
-}
\ No newline at end of file
+    'vpc_cidr_block': '10.1.0.0/16',
+    # Subnet blocks are planned from the VPC block, one per tier and AZ.
+    # Set <tier>_subnet_cidr_blocks to pin them instead
+    'subnet_tiers': [
+        {'name': 'public', 'public': True, 'prefix_length': 24},
+        {'name': 'private', 'public': False, 'prefix_length': 24},
+    ],
+    'availability_zones': ['us-east-1a', 'us-east-1b'],
+    'tags': {
+        'Name': 'demo-network1',
+        'ProjectName': 'demo-troposphere-network',
+        'env': 'prd'
+    }
+}
@@ -6,5 +6,28 @@ config = {
                                'PYTHON_ENV environment variable for'
                                'network resources creation.',
     'project_name': 'demo-s3-cloudfront',
-    'default_root_object': 'index.html'
+    'stack_name': 'ansible-demo-s3-cloudfront',
+    'default_root_object': 'index.html',
+    # Precompressed variants of the assets, in order of preference
+    'precompressed_encodings': ['br', 'gzip'],
+    # Days superseded assets are kept, so pages cached before a publish can
+    # still load them
+    'superseded_assets_retention_days': 30,
+    # Distribution performance profile. Policies are managed policy names or
+    # policy ids, behaviors default to the profile values
+    'cloudfront': {
+        'http_version': 'http2and3',
+        'price_class': 'PriceClass_100',
+        'viewer_protocol_policy': 'redirect-to-https',
+        'compress': True,
+        'cache_policy': 'CachingOptimized',
+        'origin_request_policy': 'CORS-S3Origin',
+        'origin_shield_region': None,
+        'cache_behaviors': [
+            # Fingerprinted assets written by assets.py, cached as long as
+            # their Cache-Control allows
+            {'path_pattern': 'assets/*', 'precompressed': True},
+            {'path_pattern': 'index.html', 'cache_policy': 'CachingDisabled'},
+        ],
+    },
 }
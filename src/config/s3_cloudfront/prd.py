@@ -1,3 +1,11 @@
 config = {
-    'test_var': 'testprod'
-}
\ No newline at end of file
+    'cloudfront': {
+        'price_class': 'PriceClass_All',
+        'origin_shield_region': 'us-east-1',
+    },
+    'tags': {
+        'Name': 'demo-s3-cloudfront',
+        'ProjectName': 'demo-troposphere-s3-cloudfront',
+        'env': 'prd'
+    }
+}
@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+
+import boto3
+
+from common.deploy import deploy_template
+
+parser = argparse.ArgumentParser(
+    description="Upload a template and deploy its stack, skipping both steps "
+    "when the template did not change since the last deploy."
+)
+parser.add_argument("--stack-name", required=True)
+parser.add_argument("--template", required=True, help="Path of the template file")
+parser.add_argument("--bucket", required=True, help="Bucket the template is put in")
+parser.add_argument("--key", help="Object key (default: template file name)")
+parser.add_argument(
+    "-p",
+    "--parameter",
+    action="append",
+    default=[],
+    metavar="KEY=VALUE",
+    help="Stack parameter, can be repeated",
+)
+parser.add_argument(
+    "--parameters-file",
+    help="Json file of stack parameters, as written by build.py --parameterized",
+)
+parser.add_argument(
+    "--nested",
+    nargs="+",
+    default=[],
+    help="Nested stack templates uploaded next to the template",
+)
+parser.add_argument("--region")
+parser.add_argument("--profile")
+parser.add_argument(
+    "--no-wait", action="store_true", help="Do not wait for the stack operation"
+)
+args = parser.parse_args()
+
+session = boto3.Session(profile_name=args.profile, region_name=args.region)
+
+with open(args.template) as f:
+    body = f.read()
+
+parameters = {}
+if args.parameters_file:
+    with open(args.parameters_file) as f:
+        parameters = json.load(f)
+parameters.update(p.split("=", 1) for p in args.parameter)
+
+key = args.key or os.path.basename(args.template)
+nested = {}
+for path in args.nested:
+    with open(path) as f:
+        nested[os.path.join(os.path.dirname(key), os.path.basename(path))] = f.read()
+
+deployed = deploy_template(
+    session.client("cloudformation"),
+    session.client("s3"),
+    args.bucket,
+    key,
+    args.stack_name,
+    body,
+    parameters,
+    nested,
+    wait=not args.no_wait,
+)
+
+print(f"{args.stack_name}: {'deployed' if deployed else 'unchanged'}")
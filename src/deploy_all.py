@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+
+import boto3
+from cfn_flip import load
+
+from common.build import STACKS
+from common.config import resolve_config
+from common.deploy import deploy_template, template_url
+from common.orchestrator import (
+    critical_path,
+    dependency_graph,
+    deploy_stacks,
+    topological_order,
+)
+
+parser = argparse.ArgumentParser(
+    description="Deploy built templates, stacks run in parallel unless one "
+    "imports a value exported by another."
+)
+parser.add_argument(
+    "-s", "--stacks", nargs="+", choices=STACKS, default=STACKS, help="Stacks to deploy"
+)
+parser.add_argument(
+    "-t",
+    "--templates-dir",
+    default="build",
+    help="Directory holding the <stack>.<format> templates (default: build)",
+)
+parser.add_argument("-f", "--format", choices=["yaml", "json"], default="yaml")
+parser.add_argument(
+    "-e", "--env", default=os.environ.get("PYTHON_ENV", "dev"), help="Environment"
+)
+parser.add_argument("--bucket", required=True, help="Bucket the templates are put in")
+parser.add_argument("-j", "--jobs", type=int, help="Stacks deployed at the same time")
+parser.add_argument("--region")
+parser.add_argument("--profile")
+args = parser.parse_args()
+
+session = boto3.Session(profile_name=args.profile, region_name=args.region)
+cfn = session.client("cloudformation")
+s3 = session.client("s3")
+
+bodies = {}
+keys = {}
+parameters = {}
+nested = {}
+for stack in args.stacks:
+    stack_name = resolve_config(stack, args.env)["stack_name"]
+    keys[stack_name] = f"{args.env}/{stack}.{args.format}"
+    with open(os.path.join(args.templates_dir, f"{stack}.{args.format}")) as f:
+        bodies[stack_name] = f.read()
+    # Nested stack templates written next to the template by build.py
+    # --split-url, uploaded next to it as with deploy.py --nested
+    nested[stack_name] = {}
+    for resource in load(bodies[stack_name])[0]["Resources"].values():
+        url = resource.get("Properties", {}).get("TemplateURL")
+        if resource["Type"] != "AWS::CloudFormation::Stack" or not isinstance(url, str):
+            continue
+        nested_path = os.path.join(args.templates_dir, os.path.basename(url))
+        if not os.path.exists(nested_path):
+            continue
+        nested_key = f"{args.env}/{os.path.basename(url)}"
+        if url != template_url(args.bucket, nested_key):
+            parser.error(
+                f"{nested_path} is referenced as {url}, build it with --split-url "
+                f"{template_url(args.bucket, args.env)}"
+            )
+        with open(nested_path) as f:
+            nested[stack_name][nested_key] = f.read()
+    # Written next to the template by build.py --parameterized
+    parameters_path = os.path.join(
+        args.templates_dir, f"{stack}-{args.env}-parameters.json"
+    )
+    if os.path.exists(parameters_path):
+        with open(parameters_path) as f:
+            parameters[stack_name] = json.load(f)
+
+graph = dependency_graph(
+    {name: load(body)[0] for name, body in bodies.items()},
+    {
+        name: [load(body)[0] for body in templates.values()]
+        for name, templates in nested.items()
+    },
+)
+
+
+def deploy(stack_name):
+    return deploy_template(
+        cfn,
+        s3,
+        args.bucket,
+        keys[stack_name],
+        stack_name,
+        bodies[stack_name],
+        parameters.get(stack_name),
+        nested[stack_name],
+    )
+
+
+results = deploy_stacks(graph, deploy, args.jobs)
+for stack_name in topological_order(graph):
+    result = results[stack_name]
+    line = f"{stack_name}: {result['status']} in {result['duration']:.1f}s"
+    if result["error"]:
+        line += f" ({result['error']})"
+    print(line)
+
+path, duration = critical_path(
+    graph, {name: result["duration"] for name, result in results.items()}
+)
+print(f"Critical path: {' -> '.join(path)} ({duration:.1f}s)")
+
+if any(result["error"] for result in results.values()):
+    raise SystemExit(1)
@@ -1,11 +1,17 @@
-from config.ecs_service.config import config
-from pkg.ecs_service import generate_template
-
+import sys
 
-t = generate_template(config)
+from config.ecs_service.config import config
+from common.build import render_stack
+from common.writer import replace_file
 
 # print(config.config['public_subnet_cidr_blocks'][0])
 # print(config.config['tags']['ProjectName'])
 # print(config.config['tags'])
 
-print(t.to_yaml())
+# Write to the given path, or stream to stdout. The template is the one
+# build.py writes, with the redundant DependsOn pruned
+if len(sys.argv) > 1:
+    with replace_file(sys.argv[1]) as f:
+        render_stack("ecs_service", config, f)
+else:
+    render_stack("ecs_service", config, sys.stdout)
@@ -0,0 +1,44 @@
+import argparse
+import os
+
+from common.build import FORMATS
+from common.cache import DEFAULT_CACHE_DIR, TemplateCache
+from common.fleet import build_fleet, load_manifest
+
+parser = argparse.ArgumentParser(
+    description="Generate one ecs_service template per service of a manifest."
+)
+parser.add_argument("manifest", help="yaml or json manifest of the services")
+parser.add_argument(
+    "-o",
+    "--output-dir",
+    default=os.path.join("build", "fleet"),
+    help="Directory the templates are written to (default: build/fleet)",
+)
+parser.add_argument("-f", "--format", choices=FORMATS, default="yaml")
+parser.add_argument(
+    "-e", "--env", default=os.environ.get("PYTHON_ENV"), help="Environment"
+)
+parser.add_argument(
+    "--cache-dir",
+    default=DEFAULT_CACHE_DIR,
+    help=f"Directory of the rendered template cache (default: {DEFAULT_CACHE_DIR})",
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="Always regenerate the templates, bypassing the cache",
+)
+args = parser.parse_args()
+
+cache = None if args.no_cache else TemplateCache(args.cache_dir)
+
+try:
+    paths = build_fleet(
+        args.output_dir, load_manifest(args.manifest), args.env, args.format, cache
+    )
+except ValueError as e:
+    raise SystemExit(str(e))
+
+for service, path in paths.items():
+    print(f"{service}: {path}")
@@ -11,15 +11,22 @@ from troposphere import (
 )
 from troposphere.ec2 import SecurityGroup, SecurityGroupRule
 from troposphere.iam import Role, PolicyType
-from troposphere.ecs import Cluster
+from troposphere.ecs import (
+    Cluster,
+    ClusterCapacityProviderAssociations,
+    CapacityProviderStrategy,
+)
 import troposphere.elasticloadbalancingv2 as elb
 
+from common.ecs import capacity_provider_strategy
+from common.elb import elb_attributes
+
 
 def generate_template(d):
 
     # Set template metadata
     t = Template()
-    t.add_version("2010-09-09")
+    t.set_version("2010-09-09")
     t.set_description(d["cf_template_description"])
 
     # aws_account_id = Ref("AWS::AccountId")
@@ -50,6 +57,13 @@ def generate_template(d):
                 ImportValue(d["network_stack_name"] + "-PublicSubnetId1"),
                 ImportValue(d["network_stack_name"] + "-PublicSubnetId2"),
             ],
+            LoadBalancerAttributes=elb_attributes(
+                elb.LoadBalancerAttributes,
+                {
+                    "idle_timeout.timeout_seconds": d["load_balancer"]["idle_timeout"],
+                    "routing.http2.enabled": d["load_balancer"]["http2"],
+                },
+            ),
             Tags=Tags(d["tags"]),
         )
     )
@@ -59,6 +73,19 @@ def generate_template(d):
         Cluster("ECSCluster", ClusterName=d["project_name"], Tags=Tags(d["tags"]))
     )
 
+    # Capacity providers services can run on, services without a strategy of
+    # their own use the default one
+    t.add_resource(
+        ClusterCapacityProviderAssociations(
+            "ECSClusterCapacityProviders",
+            Cluster=Ref(ECSCluster),
+            CapacityProviders=d["capacity_providers"],
+            DefaultCapacityProviderStrategy=capacity_provider_strategy(
+                CapacityProviderStrategy, d["default_capacity_provider_strategy"]
+            ),
+        )
+    )
+
     # ECS cluster SG
     ClusterSG = t.add_resource(
         SecurityGroup(
@@ -483,6 +510,15 @@ def generate_template(d):
         )
     )
 
+    t.add_output(
+        Output(
+            "ALBFullName",
+            Description="ALB full name, used as metric dimension.",
+            Export=Export(Sub("${AWS::StackName}-ALBFullName")),
+            Value=GetAtt(ALB, "LoadBalancerFullName"),
+        )
+    )
+
     t.add_output(
         Output(
             "ECSClusterSG",
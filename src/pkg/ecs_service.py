@@ -1,9 +1,19 @@
-from troposphere import Template, Ref, Tags, ImportValue, Join
-from troposphere.ec2 import SecurityGroup, SecurityGroupRule
+from functools import lru_cache
+
+from troposphere import Template, Ref, Tags, ImportValue, Join, GetAtt
+from troposphere.applicationautoscaling import (
+    ScalableTarget,
+    ScalableTargetAction,
+    ScalingPolicy,
+    ScheduledAction,
+    PredefinedMetricSpecification,
+    TargetTrackingScalingPolicyConfiguration,
+)
 from troposphere.codebuild import (
     Project,
     Artifacts,
     EnvironmentVariable,
+    ProjectCache,
     Source,
     Environment,
 )
@@ -18,10 +28,11 @@ from troposphere.codepipeline import (
 )
 from troposphere.ecr import Repository
 from troposphere.ecs import (
-    Cluster,
     Service,
+    CapacityProviderStrategyItem,
     TaskDefinition,
     ContainerDefinition,
+    RuntimePlatform,
     NetworkConfiguration,
     AwsvpcConfiguration,
     PortMapping,
@@ -30,44 +41,274 @@ from troposphere.ecs import (
 )
 import troposphere.elasticloadbalancingv2 as elb
 
+from common.ecs import capacity_provider_strategy
+from common.elb import elb_attributes
+
+# Target tracking policies, by the autoscaling config key holding their target
+TARGET_TRACKING_POLICIES = {
+    "cpu_target": ("CPUScalingPolicy", "ECSServiceAverageCPUUtilization"),
+    "memory_target": ("MemoryScalingPolicy", "ECSServiceAverageMemoryUtilization"),
+    "requests_per_target": ("RequestCountScalingPolicy", "ALBRequestCountPerTarget"),
+}
+
+# CodeBuild environment type and image, and docker platform of each CPU
+# architecture a task can run on
+ARCHITECTURES = {
+    "X86_64": ("LINUX_CONTAINER", "aws/codebuild/standard:4.0", "linux/amd64"),
+    "ARM64": (
+        "ARM_CONTAINER",
+        "aws/codebuild/amazonlinux2-aarch64-standard:3.0",
+        "linux/arm64",
+    ),
+}
+
+# Protocol versions a target group may use behind a listener of each
+# protocol. The ecs_fargate stack only exports an HTTP listener
+TARGET_GROUP_PROTOCOL_VERSIONS = {
+    "HTTP": ["HTTP1"],
+    "HTTPS": ["HTTP1", "HTTP2", "GRPC"],
+}
+LISTENER_PROTOCOL = "HTTP"
+
+# Tag of the BuildKit cache image pushed next to the service images
+REGISTRY_CACHE_TAG = "buildcache"
+
+
+@lru_cache(maxsize=None)
+def cluster_imports(network_stack_name, ecs_stack_name):
+    # Only depends on the network and cluster stacks, so it is built once and
+    # shared by every service generated in the same process
+    return {
+        "execution_role": ImportValue(ecs_stack_name + "-ECSClusterRole"),
+        "codebuild_role": ImportValue(ecs_stack_name + "-CodebuildDeveloperRole"),
+        "pipeline_role": ImportValue(ecs_stack_name + "-CodePipelineRole"),
+        "cluster": ImportValue(ecs_stack_name + "-ECSClusterName"),
+        "listener": ImportValue(ecs_stack_name + "-ListenerArnHTTP"),
+        "load_balancer": ImportValue(ecs_stack_name + "-ALBFullName"),
+        "vpc": ImportValue(network_stack_name + "-VPCId"),
+        "network_configuration": NetworkConfiguration(
+            AwsvpcConfiguration=AwsvpcConfiguration(
+                Subnets=[
+                    ImportValue(network_stack_name + "-PrivateSubnetId1"),
+                    ImportValue(network_stack_name + "-PrivateSubnetId2"),
+                ],
+                SecurityGroups=[ImportValue(ecs_stack_name + "-ECSClusterSG")],
+            )
+        ),
+    }
+
+
+@lru_cache(maxsize=None)
+def action_type(category, provider):
+    return ActionTypeId(Category=category, Owner="AWS", Version="1", Provider=provider)
+
+
+def build_cache(d, name):
+    # local keeps the docker layers and sources on the build host between
+    # close builds, s3 keeps the cached paths of the buildspec in the artifact
+    # store
+    cache = d["codebuild"]["cache"]
+    if cache == "local":
+        return ProjectCache(Type="LOCAL", Modes=d["codebuild"]["local_cache_modes"])
+    if cache == "s3":
+        return ProjectCache(
+            Type="S3", Location=Join("/", [d["artifact_store"], "codebuild-cache", name])
+        )
+    if cache is None:
+        return ProjectCache(Type="NO_CACHE")
+    raise ValueError(f"Unknown codebuild cache {cache}, expected local, s3 or None")
+
+
+def target_group_properties(d):
+    # Health check cadence, protocol version and attributes of the target
+    # group, which set how fast new tasks get traffic and old ones drain
+    target_group = d["target_group"]
+    health_check = target_group["health_check"]
+    if int(health_check["timeout"]) >= int(health_check["interval"]):
+        raise ValueError(
+            f"Health check timeout {health_check['timeout']} must be shorter than "
+            f"the interval {health_check['interval']}"
+        )
+    algorithm = target_group["load_balancing_algorithm"]
+    if target_group["slow_start"] and algorithm != "round_robin":
+        raise ValueError(
+            f"Slow start is only supported with round_robin, not {algorithm}"
+        )
+
+    protocol_version = target_group["protocol_version"]
+    if protocol_version not in TARGET_GROUP_PROTOCOL_VERSIONS[LISTENER_PROTOCOL]:
+        raise ValueError(
+            f"Target group protocol version {protocol_version} does not work "
+            f"behind the {LISTENER_PROTOCOL} listener of the cluster, expected one "
+            f"of {TARGET_GROUP_PROTOCOL_VERSIONS[LISTENER_PROTOCOL]}"
+        )
+    if protocol_version == "GRPC":
+        matcher = elb.Matcher(GrpcCode=health_check["matcher"])
+    else:
+        matcher = elb.Matcher(HttpCode=health_check["matcher"])
+
+    return dict(
+        ProtocolVersion=protocol_version,
+        HealthCheckProtocol="HTTP",
+        HealthCheckPort=d["container_port"],
+        HealthCheckPath=d["tg_health_check_path"],
+        HealthCheckIntervalSeconds=health_check["interval"],
+        HealthCheckTimeoutSeconds=health_check["timeout"],
+        HealthyThresholdCount=health_check["healthy_threshold"],
+        UnhealthyThresholdCount=health_check["unhealthy_threshold"],
+        Matcher=matcher,
+        TargetGroupAttributes=elb_attributes(
+            elb.TargetGroupAttribute,
+            {
+                "deregistration_delay.timeout_seconds": target_group[
+                    "deregistration_delay"
+                ],
+                "slow_start.duration_seconds": target_group["slow_start"],
+                "load_balancing.algorithm.type": algorithm,
+            },
+        ),
+    )
+
+
+def add_autoscaling(t, d, ecs_service, target_group, cluster, load_balancer):
+    # Scalable target on the desired count of the service, with a target
+    # tracking policy for every target set in the config and the scheduled
+    # changes of the capacity range
+    scaling = d["autoscaling"]
+    if int(scaling["min_capacity"]) > int(scaling["max_capacity"]):
+        raise ValueError(
+            f"Autoscaling min_capacity {scaling['min_capacity']} is greater than "
+            f"max_capacity {scaling['max_capacity']}"
+        )
+
+    scalable_target = t.add_resource(
+        ScalableTarget(
+            "ScalableTarget",
+            MinCapacity=scaling["min_capacity"],
+            MaxCapacity=scaling["max_capacity"],
+            ResourceId=Join("/", ["service", cluster, GetAtt(ecs_service, "Name")]),
+            ScalableDimension="ecs:service:DesiredCount",
+            ServiceNamespace="ecs",
+        )
+    )
+
+    scheduled_actions = [
+        ScheduledAction(
+            ScheduledActionName=action["name"],
+            Schedule=action["schedule"],
+            Timezone=action.get("timezone", "UTC"),
+            ScalableTargetAction=ScalableTargetAction(
+                MinCapacity=action["min_capacity"],
+                MaxCapacity=action["max_capacity"],
+            ),
+        )
+        for action in scaling.get("scheduled_actions", [])
+    ]
+    if scheduled_actions:
+        scalable_target.ScheduledActions = scheduled_actions
+
+    for key, (title, metric) in TARGET_TRACKING_POLICIES.items():
+        if not scaling.get(key):
+            continue
+        metric_specification = PredefinedMetricSpecification(
+            PredefinedMetricType=metric
+        )
+        policy = t.add_resource(
+            ScalingPolicy(
+                title,
+                PolicyName=title,
+                PolicyType="TargetTrackingScaling",
+                ScalingTargetId=Ref(scalable_target),
+                TargetTrackingScalingPolicyConfiguration=(
+                    TargetTrackingScalingPolicyConfiguration(
+                        TargetValue=scaling[key],
+                        ScaleInCooldown=scaling["scale_in_cooldown"],
+                        ScaleOutCooldown=scaling["scale_out_cooldown"],
+                        PredefinedMetricSpecification=metric_specification,
+                    )
+                ),
+            )
+        )
+        if metric == "ALBRequestCountPerTarget":
+            # The target group only has request metrics once a rule of the
+            # load balancer forwards to it
+            metric_specification.ResourceLabel = Join(
+                "/", [load_balancer, GetAtt(target_group, "TargetGroupFullName")]
+            )
+            policy.DependsOn = "ListenerRule"
+
 
 def generate_template(d):
 
     # Set template metadata
     t = Template()
-    t.add_version("2010-09-09")
+    t.set_version("2010-09-09")
     t.set_description(d["cf_template_description"])
 
     aws_account_id = Ref("AWS::AccountId")
     aws_region = Ref("AWS::Region")
+    shared = cluster_imports(d["network_stack_name"], d["ecs_stack_name"])
+    name = Join("", [d["env"], "-", d["project_name"], "-", d["service_name"]])
+
+    architecture = d["cpu_architecture"]
+    if architecture not in ARCHITECTURES:
+        raise ValueError(
+            f"Unknown cpu_architecture {architecture}, expected one of "
+            f"{list(ARCHITECTURES)}"
+        )
+    build_type, build_image, platform = ARCHITECTURES[architecture]
+    # Multi-arch images are built for every architecture on the build
+    # environment of the task one, the others being emulated
+    platforms = [platform]
+    if d["multi_arch_build"]:
+        platforms += [p for _, _, p in ARCHITECTURES.values() if p != platform]
+
+    # Repository the images are pushed to
+    image_repository = Join(
+        "",
+        [
+            aws_account_id,
+            ".dkr.ecr.",
+            aws_region,
+            ".amazonaws.com/",
+            d["env"],
+            "-",
+            d["project_name"],
+            "-",
+            d["service_name"],
+        ],
+    )
+
+    # The bootstrap image lets the service start before the pipeline pushed
+    # a first image to the repository. The pipeline only swaps the image of
+    # the task definition, so the command stays the service one unless a
+    # bootstrap_command is set, an empty one running the image own command
+    bootstrap_image = d["bootstrap_image"]
+    command = d["container_command"]
+    if bootstrap_image and d["bootstrap_command"] is not None:
+        command = d["bootstrap_command"]
+    container = {}
+    if command:
+        container["EntryPoint"] = ["sh", "-c"]
+        container["Command"] = [command]
 
     # Task definition
     task_definition = t.add_resource(
         TaskDefinition(
             "TaskDefinition",
-            Family=Join("", [d["env"], "-", d["project_name"], "-", d["service_name"]]),
+            Family=name,
             RequiresCompatibilities=["FARGATE"],
             Cpu=d["container_cpu"],
             Memory=d["container_memory"],
             NetworkMode="awsvpc",
-            ExecutionRoleArn=ImportValue(d["ecs_stack_name"] + "-ECSClusterRole"),
+            RuntimePlatform=RuntimePlatform(
+                CpuArchitecture=architecture, OperatingSystemFamily="LINUX"
+            ),
+            ExecutionRoleArn=shared["execution_role"],
             ContainerDefinitions=[
                 ContainerDefinition(
-                    Name=Join(
-                        "", [d["env"], "-", d["project_name"], "-", d["service_name"]]
-                    ),
-                    Image=Join(
-                        "",
-                        [
-                            aws_account_id,
-                            ".dkr.ecr.",
-                            aws_region,
-                            ".amazonaws.com/",
-                            d["env"],
-                            d["project_name"],
-                            d["service_name"], ":latest"
-                        ],
-                    ),
+                    Name=name,
+                    Image=bootstrap_image or Join(":", [image_repository, "latest"]),
                     Essential=True,
                     PortMappings=[
                         PortMapping(
@@ -75,17 +316,16 @@ def generate_template(d):
                             HostPort=d["container_port"],
                         )
                     ],
-                    EntryPoint=["sh", "-c"],
-                    Command=[d["container_command"]],
                     LogConfiguration=LogConfiguration(
                         LogDriver="awslogs",
                         Options={
                             "awslogs-region": aws_region,
-                            "awslogs-group": Join("", [d["env"], "-", d["project_name"], "-", d["service_name"]]),
+                            "awslogs-group": name,
                             "awslogs-stream-prefix": "ecs",
                             "awslogs-create-group": "true"
                         }
-                    )
+                    ),
+                    **container,
                 )
             ],
             Tags=Tags(d["tags"], {"Name": d["project_name"] + "-task-definition"}),
@@ -96,10 +336,7 @@ def generate_template(d):
     ecr = t.add_resource(
         Repository(
             "ECR",
-            DependsOn="ListenerRule",
-            RepositoryName=Join(
-                "", [d["env"], "-", d["project_name"], "-", d["service_name"]]
-            ),
+            RepositoryName=name,
             Tags=Tags(d["tags"], {"Name": d["project_name"] + "-ecr"}),
         )
     )
@@ -108,18 +345,11 @@ def generate_template(d):
         elb.TargetGroup(
             "TargetGroup",
             Name=Join("", [d["env"], "-", d["service_name"]]),
-            HealthCheckIntervalSeconds="30",
-            HealthCheckProtocol="HTTP",
-            HealthCheckPort=d["container_port"],
-            HealthCheckTimeoutSeconds="10",
-            HealthyThresholdCount="4",
-            HealthCheckPath=d["tg_health_check_path"],
-            Matcher=elb.Matcher(HttpCode="200-299"),
             Port=d["container_port"],
-            Protocol="HTTP",
+            Protocol=LISTENER_PROTOCOL,
             TargetType="ip",
-            UnhealthyThresholdCount="3",
-            VpcId=ImportValue(d["network_stack_name"] + "-VPCId"),
+            **target_group_properties(d),
+            VpcId=shared["vpc"],
             Tags=Tags(d["tags"], {"Name": d["project_name"] + "-ecr"}),
         )
     )
@@ -127,104 +357,105 @@ def generate_template(d):
     t.add_resource(
         elb.ListenerRule(
             "ListenerRule",
-            DependsOn="TargetGroup",
-            ListenerArn=ImportValue(d["ecs_stack_name"] + "-ListenerArnHTTP"),
+            ListenerArn=shared["listener"],
             Conditions=[
                 elb.Condition(Field="path-pattern", Values=[d["application_path_api"]])
             ],
-            Actions=[elb.Action(Type="forward", TargetGroupArn=Ref(target_group))],
-            Priority="1",
+            Actions=[
+                elb.ListenerRuleAction(
+                    Type="forward", TargetGroupArn=Ref(target_group)
+                )
+            ],
+            Priority=d["listener_rule_priority"],
         )
     )
+    # A new service name lets CloudFormation replace the service, creating
+    # the new one before removing the old one. Changes that cannot be made in
+    # place need it, like moving from a LaunchType to capacity providers
+    service_name = name
+    if d["service_name_suffix"]:
+        service_name = Join("-", [name, d["service_name_suffix"]])
+
     # ECS service
     ecs_service = t.add_resource(
         Service(
             "ECSService",
-            ServiceName=Join(
-                "", [d["env"], "-", d["project_name"], "-", d["service_name"]]
-            ),
-            DependsOn="pipeline",
-            DesiredCount=d["container_desired_tasks_count"],
+            ServiceName=service_name,
+            # The target group has to be attached to the load balancer
+            DependsOn="ListenerRule",
             TaskDefinition=Ref(task_definition),
-            LaunchType="FARGATE",
-            NetworkConfiguration=NetworkConfiguration(
-                AwsvpcConfiguration=AwsvpcConfiguration(
-                    Subnets=[
-                        ImportValue(d["network_stack_name"] + "-PrivateSubnetId1"),
-                        ImportValue(d["network_stack_name"] + "-PrivateSubnetId2"),
-                    ],
-                    SecurityGroups=[ImportValue(d["ecs_stack_name"] + "-ECSClusterSG")],
-                )
+            CapacityProviderStrategy=capacity_provider_strategy(
+                CapacityProviderStrategyItem, d["capacity_provider_strategy"]
             ),
+            NetworkConfiguration=shared["network_configuration"],
             LoadBalancers=(
                 [
                     LoadBalancer(
-                        ContainerName=Join(
-                            "",
-                            [d["env"], "-", d["project_name"], "-", d["service_name"]],
-                        ),
+                        ContainerName=name,
                         ContainerPort=d["container_port"],
                         TargetGroupArn=Ref(target_group),
                     )
                 ]
             ),
-            Cluster=ImportValue(d["ecs_stack_name"] + "-ECSClusterName"),
+            Cluster=shared["cluster"],
             Tags=Tags(d["tags"], {"Name": d["project_name"] + "-ecs-service"}),
         )
     )
-    # App Autoscaling target
+    # The desired count is left to Application Auto Scaling when it is
+    # enabled, so updating the stack does not reset it
+    if d.get("autoscaling"):
+        add_autoscaling(
+            t, d, ecs_service, target_group, shared["cluster"], shared["load_balancer"]
+        )
+    else:
+        ecs_service.DesiredCount = d["container_desired_tasks_count"]
 
-    # App Autoscaling policy
+    build_variables = {}
+    if d["codebuild"]["registry_cache"]:
+        # BuildKit cache exported to and imported from the service repository
+        build_variables["DOCKER_BUILDKIT"] = "1"
+        build_variables["DOCKER_CACHE_REF"] = Join(
+            ":", [image_repository, REGISTRY_CACHE_TAG]
+        )
 
     # Codebuild project
     codebuild = t.add_resource(
         Project(
             "codebuild",
-            Name=Join("", [d["env"], "-", d["project_name"], "-", d["service_name"]]),
-            DependsOn="ECR",
-            ServiceRole=ImportValue(d["ecs_stack_name"] + "-CodebuildDeveloperRole"),
+            Name=name,
+            ServiceRole=shared["codebuild_role"],
             Artifacts=Artifacts(Name="Build", Location=d["artifact_store"], Type="S3",),
             Description="Build a docker image and send it to ecr",
             Source=Source(
                 BuildSpec="buildspec.yml",
                 Type="S3",
-                Location=d["artifact_store"] + "/" + d["artifact_name"],
+                Location=Join("/", [d["artifact_store"], d["artifact_name"]]),
             ),
+            Cache=build_cache(d, name),
             Environment=Environment(
-                ComputeType="BUILD_GENERAL1_SMALL",
-                Image="aws/codebuild/standard:4.0",
+                ComputeType=d["codebuild"]["compute_type"],
+                Image=build_image,
                 PrivilegedMode=True,
-                Type="LINUX_CONTAINER",
+                Type=build_type,
                 EnvironmentVariables=[
                     EnvironmentVariable(
                         Name="AWS_DEFAULT_REGION", Type="PLAINTEXT", Value=aws_region,
                     ),
                     EnvironmentVariable(
-                        Name="SERVICE_NAME",
-                        Type="PLAINTEXT",
-                        Value=Join(
-                            "",
-                            [d["env"], "-", d["project_name"], "-", d["service_name"]],
-                        ),
+                        Name="SERVICE_NAME", Type="PLAINTEXT", Value=name,
                     ),
                     EnvironmentVariable(
-                        Name="IMAGE_URI",
+                        Name="DOCKER_PLATFORMS",
                         Type="PLAINTEXT",
-                        Value=Join(
-                            "",
-                            [
-                                aws_account_id,
-                                ".dkr.ecr.",
-                                aws_region,
-                                ".amazonaws.com/",
-                                d["env"],
-                                "-",
-                                d["project_name"],
-                                "-",
-                                d["service_name"],
-                            ],
-                        ),
+                        Value=",".join(platforms),
                     ),
+                    EnvironmentVariable(
+                        Name="IMAGE_URI", Type="PLAINTEXT", Value=image_repository
+                    ),
+                ]
+                + [
+                    EnvironmentVariable(Name=key, Type="PLAINTEXT", Value=value)
+                    for key, value in build_variables.items()
                 ],
             ),
             Tags=Tags(d["tags"], {"Name": d["project_name"] + "-codebuild"}),
@@ -235,20 +466,15 @@ def generate_template(d):
     pipeline = t.add_resource(
         Pipeline(
             "pipeline",
-            Name=Join("", [d["env"], "-", d["project_name"], "-", d["service_name"]]),
-            RoleArn=ImportValue(d["ecs_stack_name"] + "-CodePipelineRole"),
+            Name=name,
+            RoleArn=shared["pipeline_role"],
             Stages=[
                 Stages(
                     Name="Source",
                     Actions=[
                         Actions(
                             Name="Source",
-                            ActionTypeId=ActionTypeId(
-                                Category="Source",
-                                Owner="AWS",
-                                Version="1",
-                                Provider="S3",
-                            ),
+                            ActionTypeId=action_type("Source", "S3"),
                             OutputArtifacts=[OutputArtifacts(Name="source_artifact")],
                             Configuration={
                                 "S3Bucket": d["artifact_store"],
@@ -265,12 +491,7 @@ def generate_template(d):
                             Name="Build",
                             InputArtifacts=[InputArtifacts(Name="source_artifact")],
                             OutputArtifacts=[OutputArtifacts(Name="build_artifact")],
-                            ActionTypeId=ActionTypeId(
-                                Category="Build",
-                                Owner="AWS",
-                                Version="1",
-                                Provider="CodeBuild",
-                            ),
+                            ActionTypeId=action_type("Build", "CodeBuild"),
                             Configuration={"ProjectName": Ref(codebuild)},
                             RunOrder="1",
                         )
@@ -282,26 +503,10 @@ def generate_template(d):
                         Actions(
                             Name="Deploy",
                             InputArtifacts=[InputArtifacts(Name="build_artifact")],
-                            ActionTypeId=ActionTypeId(
-                                Category="Deploy",
-                                Owner="AWS",
-                                Version="1",
-                                Provider="ECS",
-                            ),
+                            ActionTypeId=action_type("Deploy", "ECS"),
                             Configuration={
-                                "ClusterName": ImportValue(
-                                    d["ecs_stack_name"] + "-ECSClusterName"
-                                ),
-                                "ServiceName": Join(
-                                    "",
-                                    [
-                                        d["env"],
-                                        "-",
-                                        d["project_name"],
-                                        "-",
-                                        d["service_name"],
-                                    ],
-                                ),
+                                "ClusterName": shared["cluster"],
+                                "ServiceName": service_name,
                                 "FileName": "definitions.json",
                             },
                         )
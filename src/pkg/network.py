@@ -1,3 +1,5 @@
+import re
+
 from troposphere import GetAtt, Output, Sub, Export
 from troposphere import Ref, Tags, Template
 from troposphere.ec2 import (
@@ -12,16 +14,76 @@ from troposphere.ec2 import (
     NatGateway,
 )
 
+from common.cidr import check_cidrs, plan_subnets
+
+# Tiers used when the config has no subnet_tiers
+DEFAULT_SUBNET_TIERS = [
+    {"name": "public", "public": True, "prefix_length": 24},
+    {"name": "private", "public": False, "prefix_length": 24},
+]
+
+
+def tier_title(tier):
+    # Logical ids only allow alphanumeric characters
+    return "".join(
+        part.capitalize() for part in re.split(r"[^A-Za-z0-9]+", tier["name"])
+    )
+
+
+def subnet_tiers(d):
+    # Returns the subnet tiers with one CIDR block per availability zone.
+    # Blocks are taken from <tier>_subnet_cidr_blocks when present, otherwise
+    # planned from the VPC block using the tier prefix_length, around the
+    # pinned blocks
+    tiers = [dict(tier) for tier in d.get("subnet_tiers", DEFAULT_SUBNET_TIERS)]
+    az_count = len(d["availability_zones"])
+
+    titles = [tier_title(tier) for tier in tiers]
+    duplicates = sorted({title for title in titles if titles.count(title) > 1})
+    if duplicates:
+        raise ValueError(f"Subnet tier names give the same logical ids {duplicates}")
+
+    planned = [tier for tier in tiers if f"{tier['name']}_subnet_cidr_blocks" not in d]
+    pinned = [
+        cidr
+        for tier in tiers
+        for cidr in d.get(f"{tier['name']}_subnet_cidr_blocks", [])
+    ]
+    blocks = plan_subnets(
+        d["vpc_cidr_block"],
+        [tier["prefix_length"] for tier in planned],
+        az_count,
+        reserved=pinned,
+    )
+    for tier, cidr_blocks in zip(planned, blocks):
+        tier["cidr_blocks"] = cidr_blocks
+
+    for tier in tiers:
+        tier.setdefault("cidr_blocks", d.get(f"{tier['name']}_subnet_cidr_blocks"))
+        if len(tier["cidr_blocks"]) != az_count:
+            raise ValueError(
+                f"{tier['name']} tier has {len(tier['cidr_blocks'])} subnets for "
+                f"{az_count} availability zones"
+            )
+
+    check_cidrs(
+        d["vpc_cidr_block"], [cidr for tier in tiers for cidr in tier["cidr_blocks"]]
+    )
+
+    return tiers
+
 
 def generate_template(d):
     # Set template metadata
     t = Template()
-    t.add_version("2010-09-09")
+    t.set_version("2010-09-09")
     t.set_description(d["cf_template_description"])
 
-    # ref_stack_id = Ref('AWS::StackId')
-    # ref_region = Ref('AWS::Region')
-    # ref_stack_name = Ref('AWS::StackName')
+    tiers = subnet_tiers(d)
+    public_tiers = [tier for tier in tiers if tier["public"]]
+    private_tiers = [tier for tier in tiers if not tier["public"]]
+    if private_tiers and not public_tiers:
+        raise ValueError("Private subnets need a public tier for the Nat Gateways")
 
     # Create VPC
     vpc = t.add_resource(
@@ -34,69 +96,37 @@ def generate_template(d):
         )
     )
 
-    # Create Public Subnets
-    public_subnet_count = 1
-    public_subnets = []
-    az_count = 0
-    for public_subnet_cidr_block in d["public_subnet_cidr_blocks"]:
-        public_subnets.append(
-            t.add_resource(
-                Subnet(
-                    "PublicSubnet" + str(public_subnet_count),
-                    CidrBlock=public_subnet_cidr_block,
-                    VpcId=Ref(vpc),
-                    AvailabilityZone=d["availability_zones"][az_count],
-                    Tags=Tags(
-                        d["tags"],
-                        {
-                            "Name": d["project_name"]
-                            + "-public-subnet"
-                            + str(public_subnet_count)
-                        },
-                    ),
+    # Create one subnet per tier in each availability zone
+    subnets = {}
+    for tier in tiers:
+        subnets[tier["name"]] = []
+        for count, cidr_block in enumerate(tier["cidr_blocks"], 1):
+            subnets[tier["name"]].append(
+                t.add_resource(
+                    Subnet(
+                        tier_title(tier) + "Subnet" + str(count),
+                        CidrBlock=cidr_block,
+                        VpcId=Ref(vpc),
+                        AvailabilityZone=d["availability_zones"][count - 1],
+                        Tags=Tags(
+                            d["tags"],
+                            {
+                                "Name": d["project_name"]
+                                + "-"
+                                + tier["name"]
+                                + "-subnet"
+                                + str(count)
+                            },
+                        ),
+                    )
                 )
             )
-        )
-        public_subnet_count += 1
-        az_count += 1
-
-    # Create Private Subnets
-    private_subnet_count = 1
-    private_subnets = []
-    az_count = 0
-    for private_subnet_cidr_block in d["private_subnet_cidr_blocks"]:
-        private_subnets.append(
-            t.add_resource(
-                Subnet(
-                    "PrivateSubnet" + str(private_subnet_count),
-                    CidrBlock=private_subnet_cidr_block,
-                    VpcId=Ref(vpc),
-                    AvailabilityZone=d["availability_zones"][az_count],
-                    Tags=Tags(
-                        d["tags"],
-                        {
-                            "Name": d["project_name"]
-                            + "-private-subnet"
-                            + str(private_subnet_count)
-                        },
-                    ),
-                )
-            )
-        )
-        private_subnet_count += 1
-        az_count += 1
 
     # Create Internet Gateway
     internetGateway = t.add_resource(
         InternetGateway(
             "InternetGateway",
-            Tags=Tags(
-                d["tags"],
-                {
-                    "Name": d["project_name"]
-                    + "-igw"
-                }
-            ),
+            Tags=Tags(d["tags"], {"Name": d["project_name"] + "-igw"}),
         )
     )
 
@@ -109,37 +139,12 @@ def generate_template(d):
         )
     )
 
-    # Create Two EIP for each Nat Gateway
-    eip_count = 1
-    for eip in range(2):
-        t.add_resource(
-            EIP(
-                "Eip" + str(eip_count),
-                Domain="vpc",
-                Tags=Tags(
-                    d["tags"],
-                    {
-                        "Name": d["project_name"]
-                        + "-eip"
-                        + str(eip_count)
-                    }
-                ),
-            )
-        )
-        eip_count += 1
-
     # Create Public Route Table
     publicRouteTable = t.add_resource(
         RouteTable(
             "PublicRouteTable",
             VpcId=Ref(vpc),
-            Tags=Tags(
-                d["tags"],
-                {
-                    "Name": d["project_name"]
-                    + "-public-rtb"
-                }
-            ),
+            Tags=Tags(d["tags"], {"Name": d["project_name"] + "-public-rtb"}),
         )
     )
 
@@ -154,109 +159,69 @@ def generate_template(d):
         )
     )
 
-    # Create Private Route Table1
-    PrivateRouteTable1 = t.add_resource(
-        RouteTable(
-            "PrivateRouteTable1",
-            VpcId=Ref(vpc),
-            Tags=Tags(
-                d["tags"],
-                {
-                    "Name": d["project_name"]
-                    + "-private-rtb1"
-                }
-            ),
-        )
-    )
-
-    # Create Private Route Table2
-    PrivateRouteTable2 = t.add_resource(
-        RouteTable(
-            "PrivateRouteTable2",
-            VpcId=Ref(vpc),
-            Tags=Tags(
-                d["tags"],
-                {
-                    "Name": d["project_name"]
-                    + "-private-rtb2"
-                }
-            ),
-        )
-    )
-
     # Associate Public Subnets with Public Route Table
-    public_subnet_count = 1
-    for public_subnet in range(len(public_subnets)):
-        t.add_resource(
-            SubnetRouteTableAssociation(
-                "PublicSubnetRouteTableAssociation" + str(public_subnet_count),
-                SubnetId=Ref("PublicSubnet" + str(public_subnet_count)),
-                RouteTableId=Ref(publicRouteTable),
+    for tier in public_tiers:
+        for count, subnet in enumerate(subnets[tier["name"]], 1):
+            t.add_resource(
+                SubnetRouteTableAssociation(
+                    tier_title(tier) + "SubnetRouteTableAssociation" + str(count),
+                    SubnetId=Ref(subnet),
+                    RouteTableId=Ref(publicRouteTable),
+                )
             )
-        )
-        public_subnet_count += 1
 
-    # Associate Private Subnet1 with Private Route Table1
-    t.add_resource(
-        SubnetRouteTableAssociation(
-            "PrivateSubnetPrivateRouteTableAssociation1",
-            SubnetId=Ref("PrivateSubnet1"),
-            RouteTableId=Ref(PrivateRouteTable1),
+    # Create one Nat Gateway, in the first public tier, and one Private Route
+    # Table for each availability zone
+    nat_subnets = subnets[public_tiers[0]["name"]] if private_tiers else []
+    for count, nat_subnet in enumerate(nat_subnets, 1):
+        eip = t.add_resource(
+            EIP(
+                "Eip" + str(count),
+                Domain="vpc",
+                Tags=Tags(d["tags"], {"Name": d["project_name"] + "-eip" + str(count)}),
+            )
         )
-    )
 
-    # Associate Private Subnet2 with Private Route Table2
-    t.add_resource(
-        SubnetRouteTableAssociation(
-            "PrivateSubnetPrivateRouteTableAssociation2",
-            SubnetId=Ref("PrivateSubnet2"),
-            RouteTableId=Ref(PrivateRouteTable2),
+        nat = t.add_resource(
+            NatGateway(
+                "Nat" + str(count),
+                AllocationId=GetAtt(eip, "AllocationId"),
+                SubnetId=Ref(nat_subnet),
+                Tags=Tags(d["tags"], {"Name": d["project_name"] + "-nat" + str(count)}),
+            )
         )
-    )
 
-    # Create Two Nat Gateways one for each Private Route Table
-    nat_gtw_count = 1
-    public_subnet_count = 1
-    for nat_gtw in range(2):
-        t.add_resource(
-            NatGateway(
-                "Nat" + str(nat_gtw_count),
-                AllocationId=GetAtt("Eip" + str(nat_gtw_count), "AllocationId"),
-                SubnetId=Ref("PublicSubnet" + str(public_subnet_count)),
+        privateRouteTable = t.add_resource(
+            RouteTable(
+                "PrivateRouteTable" + str(count),
+                VpcId=Ref(vpc),
                 Tags=Tags(
-                    d["tags"],
-                    {
-                        "Name": d["project_name"]
-                        + "-nat"
-                        + str(public_subnet_count)
-                    },
+                    d["tags"], {"Name": d["project_name"] + "-private-rtb" + str(count)}
                 ),
             )
         )
-        nat_gtw_count += 1
-        public_subnet_count += 1
 
-    # Create route in rtb1 to nat1
-    t.add_resource(
-        Route(
-            "RouteNat1",
-            DependsOn="Nat1",
-            NatGatewayId=Ref("Nat1"),
-            DestinationCidrBlock="0.0.0.0/0",
-            RouteTableId=Ref("PrivateRouteTable1"),
+        # Create route in the private route table to the nat of the same AZ
+        t.add_resource(
+            Route(
+                "RouteNat" + str(count),
+                NatGatewayId=Ref(nat),
+                DestinationCidrBlock="0.0.0.0/0",
+                RouteTableId=Ref(privateRouteTable),
+            )
         )
-    )
 
-    # Create route in rtb2 to nat2
-    t.add_resource(
-        Route(
-            "RouteNat2",
-            DependsOn="Nat2",
-            NatGatewayId=Ref("Nat2"),
-            DestinationCidrBlock="0.0.0.0/0",
-            RouteTableId=Ref("PrivateRouteTable2"),
-        )
-    )
+        # Associate Private Subnets of the AZ with its Private Route Table
+        for tier in private_tiers:
+            t.add_resource(
+                SubnetRouteTableAssociation(
+                    tier_title(tier)
+                    + "SubnetPrivateRouteTableAssociation"
+                    + str(count),
+                    SubnetId=Ref(subnets[tier["name"]][count - 1]),
+                    RouteTableId=Ref(privateRouteTable),
+                )
+            )
 
     # Outputs
     t.add_output(
@@ -268,36 +233,16 @@ def generate_template(d):
         )
     )
 
-    public_subnet_count = 1
-    count = 0
-    for subnet in public_subnets:
-        t.add_output(
-            Output(
-                "PublicSubnet" + str(public_subnet_count),
-                Description=f"PublicSubnetId{public_subnet_count}for cross reference.",
-                Export=Export(
-                    Sub("${AWS::StackName}" + f"-PublicSubnetId{public_subnet_count}")
-                ),
-                Value=Ref(public_subnets[count]),
-            )
-        )
-        count += 1
-        public_subnet_count += 1
-
-    private_subnet_count = 1
-    count = 0
-    for subnet in private_subnets:
-        t.add_output(
-            Output(
-                "PrivateSubnet" + str(private_subnet_count),
-                Description=f"PrivateSubnetId{private_subnet_count} for cross reference.",
-                Export=Export(
-                    Sub("${AWS::StackName}" + f"-PrivateSubnetId{private_subnet_count}")
-                ),
-                Value=Ref(private_subnets[count]),
+    for tier in tiers:
+        for count, subnet in enumerate(subnets[tier["name"]], 1):
+            name = tier_title(tier) + "Subnet"
+            t.add_output(
+                Output(
+                    name + str(count),
+                    Description=f"{name}Id{count} for cross reference.",
+                    Export=Export(Sub("${AWS::StackName}" + f"-{name}Id{count}")),
+                    Value=Ref(subnet),
+                )
             )
-        )
-        count += 1
-        private_subnet_count += 1
 
     return t
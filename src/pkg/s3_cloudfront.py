@@ -1,11 +1,18 @@
+import json
+import re
+
 from troposphere import Output, Ref, Template, Join, GetAtt, Tags
 from troposphere.s3 import Bucket, Private, PublicAccessBlockConfiguration, BucketPolicy
+from troposphere.s3 import LifecycleConfiguration, LifecycleRule, TagFilter
 from troposphere.cloudfront import Distribution, DistributionConfig
 from troposphere.cloudfront import Origin, DefaultCacheBehavior
-from troposphere.cloudfront import ForwardedValues
 from troposphere.cloudfront import S3OriginConfig
 from troposphere.cloudfront import CloudFrontOriginAccessIdentity, CloudFrontOriginAccessIdentityConfig
 from troposphere.cloudfront import CustomErrorResponse, ViewerCertificate
+from troposphere.cloudfront import CacheBehavior, Function, FunctionConfig
+from troposphere.cloudfront import FunctionAssociation, OriginShield
+from troposphere.cloudfront import ResponseHeadersPolicy, ResponseHeadersPolicyConfig
+from troposphere.cloudfront import CustomHeadersConfig, CustomHeader
 from awacs.aws import (
     Allow,
     Policy,
@@ -13,6 +20,46 @@ from awacs.aws import (
     Statement
 )
 
+from common.assets import COMPRESSIBLE, ENCODINGS, SUPERSEDED_TAG
+
+# Managed policies, see the CloudFront developer guide
+MANAGED_CACHE_POLICIES = {
+    "CachingOptimized": "658327ea-f89d-4fab-a63d-7e88639e58f6",
+    "CachingOptimizedForUncompressedObjects": "b2884449-e4de-46a7-ac36-70bc7f1ddd6d",
+    "CachingDisabled": "4135ea2d-6df8-44a3-9df3-4b5a84be39ad",
+}
+MANAGED_ORIGIN_REQUEST_POLICIES = {
+    "AllViewer": "216adef6-5c7f-47e4-b989-5492eafa07d3",
+    "AllViewerExceptHostHeader": "b689b0a8-53d0-40ab-baf2-68738e2966ac",
+    "CORS-CustomOrigin": "59781a5b-3903-41f3-afcb-af62929ccde1",
+    "CORS-S3Origin": "88a5eaf4-2fd4-4709-b370-b4c650ea3fcf",
+    "UserAgentRefererHeaders": "acba4595-bd28-49b8-b9fe-13317c0390fa",
+}
+
+# Viewer request function serving the precompressed variant of an asset
+# accepted by the browser, in the order of the encodings list
+ENCODING_FUNCTION = """var ENCODINGS = %s;
+var COMPRESSIBLE = /(%s)$/;
+
+function handler(event) {
+    var request = event.request;
+    var header = request.headers["accept-encoding"];
+    if (header && COMPRESSIBLE.test(request.uri)) {
+        var accepted = header.value.split(/\\s*,\\s*/).map(function (e) {
+            return e.split(";")[0];
+        });
+        for (var i = 0; i < ENCODINGS.length; i++) {
+            if (accepted.indexOf(ENCODINGS[i][0]) !== -1) {
+                request.uri += ENCODINGS[i][1];
+                break;
+            }
+        }
+    }
+    return request;
+}
+"""
+
+
 def generate_template(d):
     t = Template()
     t.set_description(d["cf_template_description"])
@@ -28,6 +75,19 @@ def generate_template(d):
                 IgnorePublicAcls=True,
                 RestrictPublicBuckets=True,
             ),
+            # Assets the published pages no longer reference, see sync.py
+            LifecycleConfiguration=LifecycleConfiguration(
+                Rules=[
+                    LifecycleRule(
+                        Id="ExpireSupersededAssets",
+                        Status="Enabled",
+                        TagFilters=[
+                            TagFilter(Key=SUPERSEDED_TAG[0], Value=SUPERSEDED_TAG[1])
+                        ],
+                        ExpirationInDays=d["superseded_assets_retention_days"],
+                    )
+                ]
+            ),
             Tags=Tags(d["tags"], {"Name": d["project_name"]}),
         )
     )
@@ -68,30 +128,112 @@ def generate_template(d):
         )
     )
 
+    # Precompressed variants of the fingerprinted assets are picked at the
+    # edge, for the behaviors with precompressed set
+    asset_function_associations = []
+    asset_headers_policy = None
+    if d["precompressed_encodings"]:
+        encodings = [[e, ENCODINGS[e]] for e in d["precompressed_encodings"]]
+        asset_function = t.add_resource(
+            Function(
+                "AssetEncodingFunction",
+                Name=Join("-", [d["project_name"], d["env"], "asset-encoding"]),
+                AutoPublish=True,
+                FunctionCode=ENCODING_FUNCTION % (
+                    json.dumps(encodings),
+                    "|".join(re.escape(ext) for ext in COMPRESSIBLE),
+                ),
+                FunctionConfig=FunctionConfig(
+                    Comment="Serve precompressed assets",
+                    Runtime="cloudfront-js-2.0",
+                ),
+            )
+        )
+        asset_function_associations.append(FunctionAssociation(
+            EventType="viewer-request",
+            FunctionARN=GetAtt(asset_function, "FunctionMetadata.FunctionARN"),
+        ))
+        # The response depends on Accept-Encoding, shared caches must not
+        # serve one encoding to a browser that asked for another
+        asset_headers_policy = t.add_resource(
+            ResponseHeadersPolicy(
+                "AssetHeadersPolicy",
+                ResponseHeadersPolicyConfig=ResponseHeadersPolicyConfig(
+                    Name=Join("-", [d["project_name"], d["env"], "asset-headers"]),
+                    Comment="Vary precompressed assets on Accept-Encoding",
+                    CustomHeadersConfig=CustomHeadersConfig(
+                        Items=[CustomHeader(
+                            Header="Vary",
+                            Value="Accept-Encoding",
+                            Override=True,
+                        )]
+                    ),
+                ),
+            )
+        )
+
+    # Cache and origin request policies, managed ones by name or any policy id
+    profile = d["cloudfront"]
+    origin_id = Join("-", [d["project_name"], d["env"]])
+
+    def policy_id(policies, policy):
+        return policies.get(policy, policy)
+
+    def behavior_properties(behavior):
+        properties = dict(
+            TargetOriginId=origin_id,
+            ViewerProtocolPolicy=behavior.get(
+                "viewer_protocol_policy", profile["viewer_protocol_policy"]
+            ),
+            Compress=behavior.get("compress", profile["compress"]),
+            CachePolicyId=policy_id(
+                MANAGED_CACHE_POLICIES,
+                behavior.get("cache_policy", profile["cache_policy"]),
+            ),
+        )
+        origin_request_policy = behavior.get(
+            "origin_request_policy", profile["origin_request_policy"]
+        )
+        if origin_request_policy:
+            properties["OriginRequestPolicyId"] = policy_id(
+                MANAGED_ORIGIN_REQUEST_POLICIES, origin_request_policy
+            )
+        if behavior.get("precompressed") and asset_function_associations:
+            properties["FunctionAssociations"] = asset_function_associations
+            properties["ResponseHeadersPolicyId"] = Ref(asset_headers_policy)
+        return properties
+
+    origin = Origin(
+        Id=origin_id,
+        DomainName=GetAtt(S3bucket, "DomainName"),
+        S3OriginConfig=S3OriginConfig(
+            OriginAccessIdentity=Join("/",["origin-access-identity", "cloudfront", Ref(CFOriginAccessIdentity)])
+        )
+    )
+    if profile["origin_shield_region"]:
+        origin.OriginShield = OriginShield(
+            Enabled=True, OriginShieldRegion=profile["origin_shield_region"]
+        )
+
     myDistribution = t.add_resource(
         Distribution(
             "myDistribution",
             DistributionConfig=DistributionConfig(
                 Enabled=True,
-                HttpVersion='http2',
+                HttpVersion=profile["http_version"],
+                PriceClass=profile["price_class"],
                 DefaultRootObject=d['default_root_object'],
-                Origins=[Origin(
-                    Id=Join("-", [d["project_name"], d["env"]]), 
-                    DomainName=GetAtt(S3bucket, "DomainName"),
-                    S3OriginConfig=S3OriginConfig(
-                        OriginAccessIdentity=Join("/",["origin-access-identity", "cloudfront", Ref(CFOriginAccessIdentity)])
-                    )
-                )],
+                Origins=[origin],
                 DefaultCacheBehavior=DefaultCacheBehavior(
-                    TargetOriginId=Join("-", [d["project_name"], d["env"]]),
-                    ForwardedValues=ForwardedValues(
-                        QueryString=False
-                    ),
-                    ViewerProtocolPolicy="allow-all",
-                    MaxTTL=0,
-                    MinTTL=0,
-                    DefaultTTL=0,
+                    **behavior_properties({})
                 ),
+                CacheBehaviors=[
+                    CacheBehavior(
+                        PathPattern=behavior["path_pattern"],
+                        **behavior_properties(behavior)
+                    )
+                    for behavior in profile["cache_behaviors"]
+                ],
                 CustomErrorResponses=[CustomErrorResponse(
                     ErrorCachingMinTTL=0,
                     ErrorCode=404,
@@ -0,0 +1,86 @@
+import argparse
+import os
+
+import boto3
+
+from common.config import resolve_config
+from common.deploy import describe_stack
+from common.sync import sync_content
+
+parser = argparse.ArgumentParser(
+    description="Upload the static content files that changed to the bucket "
+    "of the s3_cloudfront stack and invalidate them on its distribution."
+)
+parser.add_argument(
+    "root",
+    nargs="?",
+    default=os.path.join(os.path.dirname(__file__), "..", "static_content"),
+    help="Directory of the static content (default: static_content)",
+)
+parser.add_argument(
+    "-e", "--env", default=os.environ.get("PYTHON_ENV"), help="Environment"
+)
+parser.add_argument(
+    "--stack-name",
+    help="s3_cloudfront stack whose BucketName and DistributionId outputs "
+    "are used (default: the stack_name of the config)",
+)
+parser.add_argument("--bucket", help="Bucket to upload to, instead of the stack one")
+parser.add_argument(
+    "--distribution-id", help="Distribution to invalidate, instead of the stack one"
+)
+parser.add_argument("--prefix", default="", help="Key prefix of the uploaded files")
+parser.add_argument(
+    "-j", "--jobs", type=int, default=8, help="Files uploaded at the same time"
+)
+parser.add_argument(
+    "--delete",
+    action="store_true",
+    help="Remove objects without a local file, fingerprinted assets are tagged "
+    "as superseded and expired by the bucket lifecycle rule instead",
+)
+parser.add_argument(
+    "--dry-run", action="store_true", help="Only print what would be uploaded"
+)
+parser.add_argument("--region")
+parser.add_argument("--profile")
+args = parser.parse_args()
+
+session = boto3.Session(profile_name=args.profile, region_name=args.region)
+s3 = session.client("s3")
+cloudfront = session.client("cloudfront")
+
+bucket = args.bucket
+distribution_id = args.distribution_id
+if bucket is None or distribution_id is None:
+    stack_name = (
+        args.stack_name or resolve_config("s3_cloudfront", args.env)["stack_name"]
+    )
+    stack = describe_stack(session.client("cloudformation"), stack_name)
+    if stack is None:
+        raise SystemExit(f"Stack {stack_name} does not exist")
+    outputs = {o["OutputKey"]: o["OutputValue"] for o in stack.get("Outputs", [])}
+    bucket = bucket or outputs["BucketName"]
+    distribution_id = distribution_id or outputs["DistributionId"]
+
+result = sync_content(
+    s3,
+    bucket,
+    args.root,
+    args.prefix,
+    cloudfront,
+    distribution_id,
+    args.delete,
+    args.jobs,
+    args.dry_run,
+)
+
+for key in result["uploaded"]:
+    print(f"upload: {key}")
+for key in result["deleted"]:
+    print(f"delete: {key}")
+for key in result["superseded"]:
+    print(f"supersede: {key}")
+print(f"{result['unchanged']} unchanged")
+if result["invalidation"]:
+    print(f"invalidation: {result['invalidation']}")
@@ -0,0 +1,30 @@
+import pytest
+
+from common.cidr import find_overlaps, plan_subnets
+
+
+def test_larger_blocks_are_planned_first():
+    assert plan_subnets("10.0.0.0/16", [26, 24], 2) == [
+        ["10.0.2.0/26", "10.0.2.64/26"],
+        ["10.0.0.0/24", "10.0.1.0/24"],
+    ]
+
+
+def test_reserved_blocks_are_skipped():
+    planned = plan_subnets(
+        "10.0.0.0/16", [24, 26], 3, reserved=["10.0.0.0/24", "10.0.2.0/23"]
+    )
+
+    assert planned == [
+        ["10.0.1.0/24", "10.0.4.0/24", "10.0.5.0/24"],
+        ["10.0.6.0/26", "10.0.6.64/26", "10.0.6.128/26"],
+    ]
+    reserved = ["10.0.0.0/24", "10.0.2.0/23"]
+    assert (
+        find_overlaps(reserved + [cidr for blocks in planned for cidr in blocks]) == []
+    )
+
+
+def test_full_vpc_is_rejected():
+    with pytest.raises(ValueError, match="no room left"):
+        plan_subnets("10.0.0.0/24", [25], 2, reserved=["10.0.0.0/26"])
@@ -0,0 +1,72 @@
+import json
+
+from moto.cloudformation.models import cloudformation_backends
+from moto.core import DEFAULT_ACCOUNT_ID
+
+from common.deploy import HASH_KEY, deploy_template
+from tests.conftest import BUCKET
+
+TEMPLATE = """AWSTemplateFormatVersion: "2010-09-09"
+Resources:
+  Queue:
+    Type: AWS::SQS::Queue
+"""
+
+
+def deploy(aws, body=TEMPLATE, **kwargs):
+    cfn, s3, _ = aws
+    return deploy_template(cfn, s3, BUCKET, "queue.yaml", "queue", body, **kwargs)
+
+
+def test_second_deploy_is_skipped(aws):
+    cfn, s3, _ = aws
+    assert deploy(aws)
+    version = s3.head_object(Bucket=BUCKET, Key="queue.yaml")["ETag"]
+
+    assert not deploy(aws)
+    assert s3.head_object(Bucket=BUCKET, Key="queue.yaml")["ETag"] == version
+
+
+def test_changes_are_deployed(aws):
+    assert deploy(aws)
+    assert deploy(aws, TEMPLATE.replace("Queue:", "Other:"))
+    assert deploy(aws, TEMPLATE.replace("Queue:", "Other:"), parameters={"A": 1})
+
+
+def test_hash_is_not_a_stack_tag(aws):
+    cfn, _, _ = aws
+    deploy(aws)
+
+    assert cfn.describe_stacks(StackName="queue")["Stacks"][0].get("Tags") == []
+    body = cfn.get_template(StackName="queue")["TemplateBody"]
+    assert HASH_KEY in body
+
+
+def test_review_in_progress_is_created(aws):
+    cfn, _, _ = aws
+    cfn.create_change_set(
+        StackName="queue",
+        ChangeSetName="review",
+        ChangeSetType="CREATE",
+        TemplateBody=json.dumps({"Resources": {"Queue": {"Type": "AWS::SQS::Queue"}}}),
+    )
+    stack = cfn.describe_stacks(StackName="queue")["Stacks"][0]
+    assert stack["StackStatus"] == "REVIEW_IN_PROGRESS"
+
+    assert deploy(aws)
+    stack = cfn.describe_stacks(StackName="queue")["Stacks"][0]
+    assert stack["StackStatus"] == "CREATE_COMPLETE"
+
+
+def test_rolled_back_create_is_created_again(aws):
+    cfn, _, _ = aws
+    deploy(aws, TEMPLATE.replace("Queue:", "Other:"))
+    # moto never rolls back, the failed first create is set on its backend
+    backend = cloudformation_backends[DEFAULT_ACCOUNT_ID]["us-east-1"]
+    stack_id = cfn.describe_stacks(StackName="queue")["Stacks"][0]["StackId"]
+    backend.stacks[stack_id].status = "ROLLBACK_COMPLETE"
+
+    assert deploy(aws)
+    stack = cfn.describe_stacks(StackName="queue")["Stacks"][0]
+    assert stack["StackStatus"] == "CREATE_COMPLETE"
+    assert stack["StackId"] != stack_id
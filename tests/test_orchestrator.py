@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from common.orchestrator import (
+    critical_path,
+    dependency_graph,
+    deploy_stacks,
+    topological_order,
+)
+
+GRAPH = {
+    "network": set(),
+    "ecs_fargate": {"network"},
+    "ecs_service": {"ecs_fargate"},
+    "s3_cloudfront": set(),
+}
+
+
+def test_dependents_of_a_failed_stack_are_skipped():
+    deployed = []
+
+    def deploy(stack_name):
+        if stack_name == "ecs_fargate":
+            raise RuntimeError("rollback")
+        deployed.append(stack_name)
+        return True
+
+    results = deploy_stacks(GRAPH, deploy)
+
+    assert sorted(deployed) == ["network", "s3_cloudfront"]
+    assert results["ecs_fargate"]["status"] == "failed"
+    assert results["ecs_service"]["status"] == "skipped"
+    assert results["ecs_service"]["error"] == "ecs_fargate failed"
+
+
+def test_dependencies_are_deployed_first():
+    lock = threading.Lock()
+    order = []
+
+    def deploy(stack_name):
+        with lock:
+            order.append(stack_name)
+        return stack_name != "s3_cloudfront"
+
+    results = deploy_stacks(GRAPH, deploy, max_workers=4)
+
+    assert order.index("network") < order.index("ecs_fargate")
+    assert order.index("ecs_fargate") < order.index("ecs_service")
+    assert results["s3_cloudfront"]["status"] == "unchanged"
+
+
+def test_circular_dependencies_are_rejected():
+    with pytest.raises(ValueError, match="Circular dependency"):
+        topological_order({"a": {"b"}, "b": {"a"}})
+
+
+def test_critical_path():
+    durations = {"network": 3, "ecs_fargate": 5, "ecs_service": 2, "s3_cloudfront": 9}
+
+    assert critical_path(GRAPH, durations) == (
+        ["network", "ecs_fargate", "ecs_service"],
+        10,
+    )
+
+
+def test_exports_of_nested_stacks_are_dependencies():
+    # As written by build.py --split-url once the outputs moved to the
+    # nested stack
+    child = {
+        "Outputs": {
+            "VPCId": {
+                "Value": {"Ref": "VPC"},
+                "Export": {
+                    "Name": {
+                        "Fn::Sub": [
+                            "${AWSStackNameValue}-VPCId",
+                            {"AWSStackNameValue": {"Ref": "ParentStackName"}},
+                        ]
+                    }
+                },
+            }
+        }
+    }
+    consumer = {"Resources": {"Cluster": {"VpcId": {"Fn::ImportValue": "net-VPCId"}}}}
+
+    graph = dependency_graph(
+        {"net": {"Resources": {}}, "ecs": consumer}, {"net": [child]}
+    )
+
+    assert graph == {"net": set(), "ecs": {"net"}}
@@ -0,0 +1,150 @@
+import time
+
+import pytest
+
+from common.assets import SUPERSEDED_PREFIX, SUPERSEDED_TAG
+from common.sync import sync_content
+from tests.conftest import BUCKET
+
+FILES = {
+    "index.html": '<script src="assets/app.1a2b3c.js"></script>',
+    "about.html": "about",
+    "assets/app.1a2b3c.js": "app",
+    "robots.txt": "robots",
+}
+
+
+@pytest.fixture
+def distribution(aws):
+    _, _, cloudfront = aws
+    origin = {"Id": "s3", "DomainName": f"{BUCKET}.s3.amazonaws.com"}
+    response = cloudfront.create_distribution(
+        DistributionConfig={
+            "CallerReference": str(time.time_ns()),
+            "Comment": "",
+            "Enabled": True,
+            "Origins": {
+                "Quantity": 1,
+                "Items": [{**origin, "S3OriginConfig": {"OriginAccessIdentity": ""}}],
+            },
+            "DefaultCacheBehavior": {
+                "TargetOriginId": "s3",
+                "ViewerProtocolPolicy": "redirect-to-https",
+            },
+        }
+    )
+    return response["Distribution"]["Id"]
+
+
+def write(root, files):
+    for key, content in files.items():
+        path = root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+
+
+def sync(aws, root, distribution_id, delete=False):
+    _, s3, cloudfront = aws
+    return sync_content(
+        s3,
+        BUCKET,
+        str(root),
+        cloudfront=cloudfront,
+        distribution_id=distribution_id,
+        delete=delete,
+    )
+
+
+def invalidations(aws, distribution_id):
+    _, _, cloudfront = aws
+    response = cloudfront.list_invalidations(DistributionId=distribution_id)
+    return response["InvalidationList"].get("Items", [])
+
+
+def tags(s3, key):
+    response = s3.get_object_tagging(Bucket=BUCKET, Key=key)
+    return {(tag["Key"], tag["Value"]) for tag in response["TagSet"]}
+
+
+def keys(s3):
+    response = s3.list_objects_v2(Bucket=BUCKET)
+    return [obj["Key"] for obj in response.get("Contents", [])]
+
+
+def test_only_changed_files_are_uploaded(aws, distribution, tmp_path):
+    write(tmp_path, FILES)
+    result = sync(aws, tmp_path, distribution)
+    assert result["uploaded"] == sorted(FILES)
+    # Nothing was cached before the first publish
+    assert result["invalidation"] is None
+
+    result = sync(aws, tmp_path, distribution)
+    assert result["uploaded"] == []
+    assert result["unchanged"] == len(FILES)
+    assert invalidations(aws, distribution) == []
+
+
+def test_unchanged_sync_only_lists_the_bucket(aws, distribution, tmp_path):
+    _, s3, _ = aws
+    write(tmp_path, FILES)
+    sync(aws, tmp_path, distribution)
+
+    calls = []
+    s3.meta.events.register(
+        "before-call.s3", lambda model, **kwargs: calls.append(model.name)
+    )
+    sync(aws, tmp_path, distribution, delete=True)
+
+    assert set(calls) == {"ListObjectsV2"}
+
+
+def test_replaced_and_deleted_keys_share_one_invalidation(aws, distribution, tmp_path):
+    _, s3, cloudfront = aws
+    write(tmp_path, FILES)
+    sync(aws, tmp_path, distribution)
+
+    write(tmp_path, {"about.html": "changed", "contact.html": "new"})
+    (tmp_path / "robots.txt").unlink()
+    result = sync(aws, tmp_path, distribution, delete=True)
+
+    assert result["uploaded"] == ["about.html", "contact.html"]
+    assert result["deleted"] == ["robots.txt"]
+    assert len(invalidations(aws, distribution)) == 1
+    batch = cloudfront.get_invalidation(
+        DistributionId=distribution, Id=result["invalidation"]
+    )["Invalidation"]["InvalidationBatch"]
+    assert sorted(batch["Paths"]["Items"]) == ["/about.html", "/robots.txt"]
+    assert "robots.txt" not in keys(s3)
+
+
+def test_stale_assets_are_superseded_not_deleted(aws, distribution, tmp_path):
+    _, s3, _ = aws
+    write(tmp_path, FILES)
+    sync(aws, tmp_path, distribution)
+
+    (tmp_path / "assets" / "app.1a2b3c.js").unlink()
+    write(tmp_path, {"assets/app.4d5e6f.js": "app v2"})
+    result = sync(aws, tmp_path, distribution, delete=True)
+
+    assert result["deleted"] == []
+    assert result["superseded"] == ["assets/app.1a2b3c.js"]
+    assert SUPERSEDED_TAG in tags(s3, "assets/app.1a2b3c.js")
+    assert SUPERSEDED_PREFIX + "assets/app.1a2b3c.js" in keys(s3)
+    assert result["invalidation"] is None
+    assert invalidations(aws, distribution) == []
+
+    # Publishing the old asset again removes its tag and marker
+    write(tmp_path, {"assets/app.1a2b3c.js": "app"})
+    result = sync(aws, tmp_path, distribution, delete=True)
+    assert result["uploaded"] == ["assets/app.1a2b3c.js"]
+    assert SUPERSEDED_TAG not in tags(s3, "assets/app.1a2b3c.js")
+    assert SUPERSEDED_PREFIX + "assets/app.1a2b3c.js" not in keys(s3)
+
+
+def test_dry_run_changes_nothing(aws, tmp_path):
+    _, s3, _ = aws
+    write(tmp_path, FILES)
+    result = sync_content(s3, BUCKET, str(tmp_path), dry_run=True)
+
+    assert result["uploaded"] == sorted(FILES)
+    assert "Contents" not in s3.list_objects_v2(Bucket=BUCKET)